@@ -1,40 +1,100 @@
 import firebase_admin
 from firebase_admin import auth, credentials
+import hmac
 import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
 
-# Demo mode - set to True to bypass Firebase verification for testing
-DEMO_MODE = True
+# Demo mode - bypasses Firebase verification for testing (WATTWISE_DEMO=0 to disable)
+DEMO_MODE = os.environ.get("WATTWISE_DEMO", "1") == "1"
 
-# Initialize Firebase Admin
-try:
-    firebase_admin.get_app()
-except ValueError:
+_DEMO_TOKEN = sys.intern("demo-token-for-testing")
+_DEMO_RESULT = MappingProxyType({
+    "valid": True,
+    "userid": "demo-user-123",
+    "email": "test@wattwise.app"
+})
+
+# Verified tokens are reused until they expire, for at most TOKEN_CACHE_TTL seconds
+TOKEN_CACHE_TTL = 300
+TOKEN_CACHE_MAX_SIZE = 4096
+
+_token_cache = OrderedDict()  # token -> (expires_at, result)
+_token_cache_lock = threading.Lock()
+
+# Firebase Admin is initialized on the first token that actually needs it
+_app = None
+_app_lock = threading.Lock()
+
+def _get_firebase_app():
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                try:
+                    _app = firebase_admin.get_app()
+                except ValueError:
+                    _app = firebase_admin.initialize_app()
+    return _app
+
+def _get_cached_token(token: str):
+    with _token_cache_lock:
+        entry = _token_cache.get(token)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at <= time.time():
+            del _token_cache[token]
+            return None
+        _token_cache.move_to_end(token)
+        return result
+
+def _cache_token(token: str, result: dict, exp=None):
+    expires_at = time.time() + TOKEN_CACHE_TTL
+    if exp:
+        expires_at = min(expires_at, exp)
+    with _token_cache_lock:
+        _token_cache[token] = (expires_at, result)
+        _token_cache.move_to_end(token)
+        while len(_token_cache) > TOKEN_CACHE_MAX_SIZE:
+            _token_cache.popitem(last=False)
+
+def _is_demo_token(token: str) -> bool:
+    if token is _DEMO_TOKEN:
+        return True
+    return token.isascii() and hmac.compare_digest(token, _DEMO_TOKEN)
+
+def _verify_firebase(token: str):
+    cached = _get_cached_token(token)
+    if cached is not None:
+        return cached
+
+    # Verify the ID token
+    decoded_token = auth.verify_id_token(token, app=_get_firebase_app())
+    uid = decoded_token['uid']
+    email = decoded_token.get('email')
+    result = {"valid": True, "userid": uid, "email": email}
+    _cache_token(token, result, decoded_token.get('exp'))
+    return result
+
+def _verify_token_demo(token: str):
+    # Demo mode: accept demo token for UI testing
+    if _is_demo_token(token):
+        return _DEMO_RESULT
     try:
-        firebase_admin.initialize_app()
+        return _verify_firebase(token)
     except Exception:
-        pass  # Firebase init may fail without credentials, that's ok in demo mode
+        # In demo mode, if verification fails, still allow with demo user
+        return _DEMO_RESULT
 
-def verify_token(token: str):
-    # Demo mode: accept demo token for UI testing
-    if DEMO_MODE and token == "demo-token-for-testing":
-        return {
-            "valid": True, 
-            "userid": "demo-user-123", 
-            "email": "test@wattwise.app"
-        }
-    
+def _verify_token_prod(token: str):
     try:
-        # Verify the ID token
-        decoded_token = auth.verify_id_token(token)
-        uid = decoded_token['uid']
-        email = decoded_token.get('email')
-        return {"valid": True, "userid": uid, "email": email}
+        return _verify_firebase(token)
     except Exception as e:
-        # In demo mode, if verification fails, still allow with demo user
-        if DEMO_MODE:
-            return {
-                "valid": True, 
-                "userid": "demo-user-123", 
-                "email": "test@wattwise.app"
-            }
         return {"valid": False, "error": str(e)}
+
+# Pick the implementation once so the hot path never tests DEMO_MODE
+verify_token = _verify_token_demo if DEMO_MODE else _verify_token_prod
@@ -1,73 +1,509 @@
-import json
+"""
+JSON file store for WattWise.
+Legacy backend kept for lightweight deployments; the API is served from the
+SQLite backend in database_sqlite, which exposes the same Database methods.
+"""
+import atexit
+import itertools
+import mmap
 import os
+import pickle
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date
 from typing import List, Dict, Any
 
+import orjson
+
 DB_FILE = "db.json"
 
+# Write-behind: pending mutations are flushed every FLUSH_INTERVAL seconds,
+# or immediately once FLUSH_MAX_PENDING of them have accumulated.
+FLUSH_INTERVAL = 0.2
+FLUSH_MAX_PENDING = 50
+
+TABLES = ("appliances", "readings", "daily_usage")
+
+# readings and daily_usage only ever grow (a re-saved day supersedes its
+# earlier record), so they are stored as append-only JSON Lines logs and
+# compacted once superseded records outnumber live ones.
+LOG_TABLES = ("readings", "daily_usage")
+COMPACT_MIN_DEAD = 1000
+
+# A pickled snapshot of each parsed table is kept next to it so a fresh process
+# can skip the JSON parse when the file hasn't changed (or, for the logs, only
+# parse what was appended since the snapshot).
+SNAPSHOT_SUFFIX = ".snapshot.pkl"
+
+# Tables are written compactly; set WATTWISE_DEV to pretty-print them for debugging
+JSON_OPTIONS = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if os.environ.get("WATTWISE_DEV") else 0)
+
+# Write table files in a single buffered syscall rather than many small ones
+IO_BUFFER_SIZE = 1 << 20
+
+def _normalize(record: Dict) -> Dict:
+    """Store dates as ISO strings once at write time so dumps never needs a fallback."""
+    for key, value in record.items():
+        if isinstance(value, date):
+            record[key] = value.isoformat()
+    return record
+
+class _RWLock:
+    """
+    Fair readers-writer lock: readers share it, a writer holds it alone.
+    Writers are reentrant and may also take the read side.
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            yield
+            return
+        with self._cond:
+            # Queue behind waiting writers so they aren't starved
+            while self._writer is not None or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me:
+                self._writers_waiting += 1
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._writers_waiting -= 1
+                self._writer = me
+            self._writer_depth += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer_depth -= 1
+                if not self._writer_depth:
+                    self._writer = None
+                    self._cond.notify_all()
+
 class Database:
     def __init__(self, db_file=DB_FILE):
         self.db_file = db_file
+        # Each table lives in its own file so a mutation only rewrites that table
+        base = os.path.splitext(db_file)[0]
+        self._files = {
+            table: f"{base}.{table}.jsonl" if table in LOG_TABLES else f"{base}.{table}.json"
+            for table in TABLES
+        }
+        # Parsed tables, reused until their file changes on disk
+        self._tables = {}
+        self._mtimes = {}
+        self._by_user = {}
+        self._lock = _RWLock()
+        self._dirty = set()
+        # Records appended to a log table since its last flush
+        self._log_buffer = {table: [] for table in LOG_TABLES}
+        # Superseded records still present in each log file
+        self._dead = {table: 0 for table in LOG_TABLES}
+        self._pending = 0
+        self._flush_event = threading.Event()
+        self._tmp_counter = itertools.count()
         self._ensure_db()
 
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
     def _ensure_db(self):
-        if not os.path.exists(self.db_file):
-            self._save_data({"appliances": [], "readings": [], "daily_usage": []})
+        missing = [table for table in TABLES if not os.path.exists(self._files[table])]
+        if not missing:
+            return
+        # Split a legacy single-file db.json into the per-table files
+        legacy = self._read_json(self.db_file) if os.path.exists(self.db_file) else None
+        if not isinstance(legacy, dict):
+            legacy = {}
+        for table in missing:
+            self._save_table(table, legacy.get(table, []))
+
+    @contextmanager
+    def _map_file(self, path: str):
+        """Map a file read-only so it's parsed without copying it into a bytes object."""
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b""  # Empty files can't be mapped
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield mm
+
+    def _read_json(self, path: str) -> Any:
+        with self._map_file(path) as mm:
+            view = memoryview(mm)
+            try:
+                return orjson.loads(view)
+            except orjson.JSONDecodeError:
+                return None
+            finally:
+                view.release()
+
+    def _read_log(self, table: str, path: str, rows: List[Dict] = None,
+                  offset: int = 0, dead: int = 0) -> List[Dict]:
+        """Replay a JSON Lines log from offset onto rows, giving the table's live rows."""
+        rows = [] if rows is None else rows
+        positions = None
+        if table == "daily_usage":
+            # Later records for the same user and date supersede earlier ones
+            positions = {(r.get("userId"), r.get("date")): i for i, r in enumerate(rows)}
+        torn = False
+        with self._map_file(path) as mm:
+            start, size = offset, len(mm)
+            while start < size:
+                end = mm.find(b"\n", start)
+                if end == -1:
+                    end = size
+                line = mm[start:end]
+                start = end + 1
+                if not line.strip():
+                    continue
+                try:
+                    record = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    torn = True  # Partial line from an interrupted append
+                    continue
+                if positions is None:
+                    rows.append(record)
+                    continue
+                key = (record.get("userId"), record.get("date"))
+                pos = positions.get(key)
+                if pos is None:
+                    positions[key] = len(rows)
+                    rows.append(record)
+                else:
+                    rows[pos] = record
+                    dead += 1
+        self._dead[table] = dead
+        if torn:
+            # Force a rewrite so new appends don't land after a partial line
+            self._dead[table] = COMPACT_MIN_DEAD + len(rows)
+        return rows
+
+    def _load_snapshot(self, table: str, st: os.stat_result):
+        """Return (rows, dead, parsed_bytes) from a snapshot still valid for st, else None."""
+        try:
+            with open(self._files[table] + SNAPSHOT_SUFFIX, "rb") as f:
+                ino, size, mtime_ns, rows, dead = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+            return None
+        if ino != st.st_ino:
+            return None  # File was replaced since the snapshot
+        if table in LOG_TABLES:
+            # Appends only add bytes past the snapshot, so it stays a valid prefix
+            if size > st.st_size or mtime_ns > st.st_mtime_ns:
+                return None
+        elif size != st.st_size or mtime_ns != st.st_mtime_ns:
+            return None
+        return rows, dead, size
+
+    def _drop_snapshot(self, table: str):
+        """Remove the table's snapshot; called whenever its file is replaced.
+
+        A replaced file can reuse the old inode, so the snapshot can't be
+        trusted to notice the replacement on its own.
+        """
+        try:
+            os.remove(self._files[table] + SNAPSHOT_SUFFIX)
+        except FileNotFoundError:
+            pass
 
-    def _load_data(self) -> Dict[str, Any]:
-        with open(self.db_file, "r") as f:
+    def _save_snapshot(self, table: str):
+        path = self._files[table]
+        tmp_file = f"{path}{SNAPSHOT_SUFFIX}.{os.getpid()}.{next(self._tmp_counter)}.tmp"
+        try:
+            st = os.stat(path)
+            snapshot = (st.st_ino, st.st_size, st.st_mtime_ns,
+                        self._tables[table], self._dead.get(table, 0))
+            with open(tmp_file, "wb", buffering=IO_BUFFER_SIZE) as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, path + SNAPSHOT_SUFFIX)
+        except OSError as e:
+            # The snapshot is only an optimization; the table file stays authoritative
+            print(f"Database snapshot error: {e}")
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def _serialize(self, table: str, rows: List[Dict]) -> bytes:
+        if table in LOG_TABLES:
+            return b"".join(
+                orjson.dumps(row, option=orjson.OPT_NON_STR_KEYS) + b"\n" for row in rows
+            )
+        return orjson.dumps(rows, option=JSON_OPTIONS)
+
+    def _load_table(self, table: str) -> List[Dict]:
+        with self._lock.write():
+            path = self._files[table]
+            try:
+                st = os.stat(path)
+                mtime_ns = st.st_mtime_ns
+            except FileNotFoundError:
+                st = mtime_ns = None
+            rows = self._tables.get(table)
+            # Unflushed in-memory rows are newer than whatever is on disk
+            if table in self._dirty or (rows is not None and mtime_ns == self._mtimes.get(table)):
+                return rows
+
+            snapshot = self._load_snapshot(table, st) if st is not None else None
+            if mtime_ns is None:
+                rows = []
+            elif table in LOG_TABLES:
+                if snapshot is not None:
+                    rows, dead, parsed = snapshot
+                    rows = self._read_log(table, path, rows, offset=parsed, dead=dead)
+                else:
+                    rows = self._read_log(table, path)
+            elif snapshot is not None:
+                rows = snapshot[0]
+            else:
+                rows = self._read_json(path)
+                if not isinstance(rows, list):
+                    rows = []
+            self._tables[table] = rows
+            self._mtimes[table] = mtime_ns
+            self._build_indexes(table, rows)
+            return rows
+
+    def _save_table(self, table: str, rows: List[Dict], durable: bool = True):
+        """
+        Atomically replace the table's file via a temp file + os.replace.
+        fsync is skipped for background batch flushes (durable=False).
+        """
+        with self._lock.write():
+            if rows is not self._tables.get(table):
+                self._build_indexes(table, rows)
+            path = self._files[table]
+            tmp_file = f"{path}.{os.getpid()}.{next(self._tmp_counter)}.tmp"
+            payload = self._serialize(table, rows)
+            with open(tmp_file, "wb", buffering=IO_BUFFER_SIZE) as f:
+                if hasattr(os, "posix_fallocate") and payload:
+                    try:
+                        os.posix_fallocate(f.fileno(), 0, len(payload))
+                    except OSError:
+                        pass  # Not supported on every filesystem
+                try:
+                    f.write(payload)
+                    if durable:
+                        f.flush()
+                        os.fsync(f.fileno())
+                except Exception:
+                    f.close()
+                    os.remove(tmp_file)
+                    raise
+            self._drop_snapshot(table)
+            os.replace(tmp_file, path)
+            # Record our own write so the next load doesn't reparse it
+            self._tables[table] = rows
+            self._mtimes[table] = os.stat(path).st_mtime_ns
+            self._dirty.discard(table)
+            if table in LOG_TABLES:
+                self._log_buffer[table].clear()
+                self._dead[table] = 0
+
+    def _append_log(self, table: str, durable: bool = True):
+        """Append the table's buffered records to its log file."""
+        with self._lock.write():
+            records = self._log_buffer[table]
+            if records:
+                path = self._files[table]
+                with open(path, "ab", buffering=IO_BUFFER_SIZE) as f:
+                    f.write(self._serialize(table, records))
+                    if durable:
+                        f.flush()
+                        os.fsync(f.fileno())
+                records.clear()
+                self._mtimes[table] = os.stat(path).st_mtime_ns
+            self._dirty.discard(table)
+
+    def _build_indexes(self, table: str, rows: List[Dict]):
+        """Bucket the table by userId and key rows for O(1) lookups."""
+        buckets = defaultdict(list)
+        for row in rows:
+            buckets[row.get("userId")].append(row)
+        self._by_user[table] = buckets
+        # Row positions within the table lists, for in-place delete/overwrite
+        if table == "appliances":
+            self._appliance_pos = {(a.get("userId"), a.get("id")): i for i, a in enumerate(rows)}
+        elif table == "daily_usage":
+            self._daily_pos = {(d.get("userId"), d.get("date")): i for i, d in enumerate(rows)}
+            # Position of each day within its user's bucket
+            self._daily_user_pos = {
+                (user_id, d.get("date")): i
+                for user_id, user_rows in buckets.items()
+                for i, d in enumerate(user_rows)
+            }
+
+    def _mark_dirty(self, table: str):
+        """Queue the table for the background flusher."""
+        self._dirty.add(table)
+        self._pending += 1
+        if self._pending >= FLUSH_MAX_PENDING:
+            self._flush_event.set()
+
+    def _flush_loop(self):
+        while True:
+            self._flush_event.wait(FLUSH_INTERVAL)
+            self._flush_event.clear()
             try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                return {"appliances": [], "readings": [], "daily_usage": []}
+                self.flush(durable=False)
+            except Exception as e:
+                print(f"Database flush error: {e}")
+
+    def flush(self, durable: bool = True):
+        """Write pending changes to disk now."""
+        with self._lock.write():
+            flushed = list(self._dirty)
+            for table in flushed:
+                rows = self._tables[table]
+                if table not in LOG_TABLES:
+                    self._save_table(table, rows, durable=durable)
+                elif self._dead[table] >= COMPACT_MIN_DEAD and self._dead[table] > len(rows):
+                    # Compact: rewrite the log with only the live rows
+                    self._save_table(table, rows, durable=durable)
+                else:
+                    self._append_log(table, durable=durable)
+            self._pending = 0
+            if durable:
+                # Background flushes skip this; snapshots are refreshed on
+                # explicit and exit-time flushes
+                for table in flushed:
+                    self._save_snapshot(table)
 
-    def _save_data(self, data: Dict[str, Any]):
-        with open(self.db_file, "w") as f:
-            json.dump(data, f, indent=4, default=str)
+    def _is_fresh(self, table: str) -> bool:
+        if table in self._dirty:
+            return True
+        if table not in self._tables:
+            return False
+        try:
+            return os.stat(self._files[table]).st_mtime_ns == self._mtimes.get(table)
+        except FileNotFoundError:
+            return self._mtimes.get(table) is None
+
+    def _read_user(self, table: str, user_id: str, view):
+        """Apply view to the user's rows; concurrent readers share the lock."""
+        with self._lock.read():
+            if self._is_fresh(table):
+                return view(self._by_user[table].get(user_id, []))
+        # Stale or not yet loaded: reparse under the write lock
+        with self._lock.write():
+            self._load_table(table)
+            return view(self._by_user[table].get(user_id, []))
+
+    def _user_json(self, table: str, user_id: str) -> bytes:
+        # Serialize the indexed bucket directly instead of copying it first
+        return self._read_user(
+            table, user_id, lambda rows: orjson.dumps(rows, option=orjson.OPT_NON_STR_KEYS)
+        )
 
     def get_appliances(self, user_id: str):
-        data = self._load_data()
-        all_apps = data.get("appliances", [])
-        return [app for app in all_apps if app.get("userId") == user_id]
+        return self._read_user("appliances", user_id, list)
+
+    def get_appliances_json(self, user_id: str) -> bytes:
+        """JSON-encoded appliances for a response body, serialized straight from the index."""
+        return self._user_json("appliances", user_id)
 
     def add_appliance(self, appliance: Dict, user_id: str):
-        data = self._load_data()
-        appliance["userId"] = user_id
-        data.setdefault("appliances", []).append(appliance)
-        self._save_data(data)
-    
+        with self._lock.write():
+            apps = self._load_table("appliances")
+            _normalize(appliance)
+            appliance["userId"] = user_id
+            apps.append(appliance)
+            self._by_user["appliances"][user_id].append(appliance)
+            self._appliance_pos[(user_id, appliance.get("id"))] = len(apps) - 1
+            self._mark_dirty("appliances")
+
     def delete_appliance(self, app_id: str, user_id: str):
-        data = self._load_data()
-        apps = data.get("appliances", [])
-        # Filter out the specific appliance for this user
-        data["appliances"] = [a for a in apps if not (a["id"] == app_id and a.get("userId") == user_id)]
-        self._save_data(data)
+        with self._lock.write():
+            apps = self._load_table("appliances")
+            pos = self._appliance_pos.pop((user_id, app_id), None)
+            if pos is None:
+                return
+            # Unordered O(1) delete: move the last appliance into the freed slot
+            appliance = apps[pos]
+            last = apps.pop()
+            if last is not appliance:
+                apps[pos] = last
+                self._appliance_pos[(last.get("userId"), last.get("id"))] = pos
+            user_apps = self._by_user["appliances"][user_id]
+            user_apps[:] = [a for a in user_apps if a is not appliance]
+            self._mark_dirty("appliances")
 
     def get_readings(self, user_id: str):
-        data = self._load_data()
-        all_readings = data.get("readings", [])
-        return [r for r in all_readings if r.get("userId") == user_id]
+        return self._read_user("readings", user_id, list)
+
+    def get_readings_json(self, user_id: str) -> bytes:
+        return self._user_json("readings", user_id)
 
     def add_reading(self, reading: Dict, user_id: str):
-        data = self._load_data()
-        reading["userId"] = user_id
-        data.setdefault("readings", []).append(reading)
-        self._save_data(data)
+        self.add_readings_bulk([reading], user_id)
+
+    def add_readings_bulk(self, readings: List[Dict], user_id: str):
+        """Add many readings with a single index update and flush."""
+        if not readings:
+            return
+        with self._lock.write():
+            table = self._load_table("readings")
+            for reading in readings:
+                _normalize(reading)
+                reading["userId"] = user_id
+            table.extend(readings)
+            self._by_user["readings"][user_id].extend(readings)
+            self._log_buffer["readings"].extend(readings)
+            self._mark_dirty("readings")
 
     def get_daily_usage(self, user_id: str):
-        data = self._load_data()
-        all_daily = data.get("daily_usage", [])
-        return [d for d in all_daily if d.get("userId") == user_id]
+        return self._read_user("daily_usage", user_id, list)
+
+    def get_daily_usage_json(self, user_id: str) -> bytes:
+        return self._user_json("daily_usage", user_id)
 
     def save_daily_usage(self, usage: Dict, user_id: str):
-        data = self._load_data()
-        usage["userId"] = user_id
-        daily = data.get("daily_usage", [])
-        
-        # Remove existing for same date AND same user
-        daily = [d for d in daily if not (d["date"] == usage["date"] and d.get("userId") == user_id)]
-        
-        daily.append(usage)
-        data["daily_usage"] = daily
-        self._save_data(data)
+        self.save_daily_usage_bulk([usage], user_id)
+
+    def save_daily_usage_bulk(self, usages: List[Dict], user_id: str):
+        """Save many days at once; a day already stored for the user is replaced."""
+        if not usages:
+            return
+        with self._lock.write():
+            daily = self._load_table("daily_usage")
+            user_daily = self._by_user["daily_usage"][user_id]
+            for usage in usages:
+                _normalize(usage)
+                usage["userId"] = user_id
+
+                # Replace existing for same date AND same user in place
+                key = (user_id, usage["date"])
+                pos = self._daily_pos.get(key)
+                if pos is None:
+                    daily.append(usage)
+                    user_daily.append(usage)
+                    self._daily_pos[key] = len(daily) - 1
+                    self._daily_user_pos[key] = len(user_daily) - 1
+                else:
+                    daily[pos] = usage
+                    user_daily[self._daily_user_pos[key]] = usage
+                    self._dead["daily_usage"] += 1
+            self._log_buffer["daily_usage"].extend(usages)
+            self._mark_dirty("daily_usage")
 
 db = Database()
@@ -0,0 +1,33 @@
+"""
+Async facade over the SQLite database for async API handlers.
+Each call runs the pooled sync method in a worker thread, so handlers can
+`await adb.get_daily_usage(...)` without blocking the event loop.
+"""
+import asyncio
+import functools
+
+from database_sqlite import Database, db
+
+class AsyncDatabase:
+    def __init__(self, database: Database = db):
+        self._db = database
+
+    def __getattr__(self, name):
+        attr = getattr(self._db, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            # sqlite3 releases the GIL while it works, so calls overlap across threads
+            return await asyncio.to_thread(attr, *args, **kwargs)
+
+        # Cache the wrapper so later lookups skip __getattr__
+        setattr(self, name, call)
+        return call
+
+    def close(self):
+        self._db.close()
+
+# Global instance
+adb = AsyncDatabase()
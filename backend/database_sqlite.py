@@ -3,25 +3,470 @@ SQLite Database Module for WattWise
 Provides persistent storage with proper schema for multi-user support.
 """
 import sqlite3
+import itertools
 import os
-import json
-from typing import List, Dict, Any, Optional
+import mmap
+import queue
+import pathlib
+import threading
+import time
+from typing import List, Dict, Any, Iterable, NamedTuple, Optional, Tuple
 from datetime import datetime, date
+from collections import OrderedDict
 from contextlib import contextmanager
 
+import orjson
+
 DB_FILE = "wattwise.db"
 
+# Long-lived connections shared across requests, keeping SQLite's page cache warm
+POOL_SIZE = 8
+POOL_TIMEOUT = 30
+
+# Background upkeep: refresh planner statistics every MAINTENANCE_INTERVAL
+# seconds and truncate the WAL on every CHECKPOINT_EVERY-th run
+MAINTENANCE_INTERVAL = 900
+CHECKPOINT_EVERY = 4
+
+# Per-user settings, budget goals, billing cycles and recent daily usage are
+# served from memory for this many seconds and invalidated on every save.
+# The least recently used entries are dropped beyond CACHE_MAX_SIZE.
+CACHE_TTL = 30.0
+CACHE_MAX_SIZE = 4096
+_MISSING = object()
+
+# Bulk writes commit every BULK_BATCH_SIZE rows, so a large import doesn't hold
+# the write lock (or grow the WAL) for its whole length
+BULK_BATCH_SIZE = 2000
+
+# Per-connection settings; journal_mode=WAL is persistent and set once in _init_db.
+# foreign_keys stays off: rows reference users(id), which is never populated.
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=30000",
+)
+
+# Column order of the SELECTs below, zipped straight into result dicts
+APPLIANCE_KEYS = ("id", "name", "power_rating_watts", "usage_duration_hours_per_day", "category")
+READING_KEYS = ("date", "time_of_day", "reading_kwh")
+DAILY_USAGE_KEYS = ("date", "consumption_kwh", "cost", "is_anomaly", "readings_count")
+MONTHLY_DAILY_KEYS = ("date", "consumption_kwh", "cost", "is_anomaly")
+
+# Columns aliased as "name [boolean]" come back as Python bools, converted
+# while the row is fetched (connections use PARSE_COLNAMES)
+sqlite3.register_converter("boolean", lambda value: value != b"0")
+
+# Statements are module constants so each connection's statement cache
+# reuses the compiled form instead of re-preparing identical SQL.
+
+# Health check run on every pool checkout
+SQL_PING = "SELECT 1"
+
+SQL_HAS_APPLIANCES = "SELECT 1 FROM appliances LIMIT 1"
+
+SQL_GET_APPLIANCES = """
+    SELECT id, name, power_rating_watts, usage_duration_hours_per_day, category
+    FROM appliances WHERE user_id = ?
+    ORDER BY created_at DESC
+"""
+
+SQL_ADD_APPLIANCE = """
+    INSERT INTO appliances
+    (id, user_id, name, power_rating_watts, usage_duration_hours_per_day, category)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+SQL_DELETE_APPLIANCE = "DELETE FROM appliances WHERE id = ? AND user_id = ?"
+
+SQL_GET_READINGS = """
+    SELECT date, time_of_day, reading_kwh
+    FROM readings WHERE user_id = ?
+    ORDER BY date DESC, time_of_day
+"""
+
+SQL_GET_READINGS_FOR_DATE = """
+    SELECT date, time_of_day, reading_kwh
+    FROM readings
+    WHERE user_id = ? AND date = ?
+"""
+
+# Upserts skip the UPDATE when nothing changed, so re-saving identical values
+# writes no pages and fires no rollup trigger
+SQL_ADD_READING = """
+    INSERT INTO readings
+    (user_id, date, time_of_day, reading_kwh)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_id, date, time_of_day) DO UPDATE SET
+        reading_kwh = excluded.reading_kwh
+    WHERE reading_kwh IS NOT excluded.reading_kwh
+"""
+
+SQL_GET_READING = """
+    SELECT date, time_of_day, reading_kwh
+    FROM readings
+    WHERE user_id = ? AND date = ? AND time_of_day = ?
+"""
+
+SQL_UPDATE_READING = """
+    UPDATE readings
+    SET reading_kwh = ?
+    WHERE user_id = ? AND date = ? AND time_of_day = ?
+"""
+
+SQL_GET_DAILY_USAGE = """
+    SELECT date, consumption_kwh, cost,
+        COALESCE(is_anomaly, 0) as "is_anomaly [boolean]", readings_count
+    FROM daily_usage WHERE user_id = ?
+    ORDER BY date DESC
+    LIMIT ?
+"""
+
+# Next page of SQL_GET_DAILY_USAGE: a keyset seek to the days before the last one seen
+SQL_GET_DAILY_USAGE_BEFORE = """
+    SELECT date, consumption_kwh, cost,
+        COALESCE(is_anomaly, 0) as "is_anomaly [boolean]", readings_count
+    FROM daily_usage WHERE user_id = ? AND date < ?
+    ORDER BY date DESC
+    LIMIT ?
+"""
+
+SQL_SAVE_DAILY_USAGE = """
+    INSERT INTO daily_usage
+    (user_id, date, consumption_kwh, cost, is_anomaly, readings_count)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, date) DO UPDATE SET
+        consumption_kwh = excluded.consumption_kwh,
+        cost = excluded.cost,
+        is_anomaly = excluded.is_anomaly,
+        readings_count = excluded.readings_count
+    WHERE consumption_kwh IS NOT excluded.consumption_kwh
+        OR cost IS NOT excluded.cost
+        OR is_anomaly IS NOT excluded.is_anomaly
+        OR readings_count IS NOT excluded.readings_count
+"""
+
+SQL_MONTHLY_DAILY = """
+    SELECT date, consumption_kwh, cost,
+        COALESCE(is_anomaly, 0) as "is_anomaly [boolean]"
+    FROM daily_usage
+    WHERE user_id = ? AND date >= ? AND date < ?
+    ORDER BY date
+"""
+
+# Per-month rows, read from the at most 12 monthly_rollup rows of the year
+SQL_YEARLY_BY_MONTH = """
+    SELECT
+        year_month % 100 as month,
+        total_kwh,
+        total_cost,
+        days as days_recorded
+    FROM monthly_rollup
+    WHERE user_id = ? AND year_month BETWEEN ? AND ?
+    ORDER BY month
+"""
+
+SQL_MONTH_TOTALS = """
+    SELECT year_month, total_kwh, total_cost, days
+    FROM monthly_rollup
+    WHERE user_id = ? AND year_month BETWEEN ? AND ?
+"""
+
+# Triggers keeping monthly_rollup in step with every daily_usage write,
+# including upserts (which fire the UPDATE trigger) and the JSON migration
+SQL_ROLLUP_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_daily_usage_rollup_insert
+    AFTER INSERT ON daily_usage
+    BEGIN
+        INSERT INTO monthly_rollup (user_id, year_month, total_kwh, total_cost, days)
+        VALUES (NEW.user_id, NEW.year_month, NEW.consumption_kwh, NEW.cost, 1)
+        ON CONFLICT(user_id, year_month) DO UPDATE SET
+            total_kwh = total_kwh + excluded.total_kwh,
+            total_cost = total_cost + excluded.total_cost,
+            days = days + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_daily_usage_rollup_update
+    AFTER UPDATE OF user_id, date, consumption_kwh, cost ON daily_usage
+    BEGIN
+        UPDATE monthly_rollup SET
+            total_kwh = total_kwh - OLD.consumption_kwh,
+            total_cost = total_cost - OLD.cost,
+            days = days - 1
+        WHERE user_id = OLD.user_id AND year_month = OLD.year_month;
+        INSERT INTO monthly_rollup (user_id, year_month, total_kwh, total_cost, days)
+        VALUES (NEW.user_id, NEW.year_month, NEW.consumption_kwh, NEW.cost, 1)
+        ON CONFLICT(user_id, year_month) DO UPDATE SET
+            total_kwh = total_kwh + excluded.total_kwh,
+            total_cost = total_cost + excluded.total_cost,
+            days = days + 1;
+        DELETE FROM monthly_rollup
+        WHERE user_id = OLD.user_id AND year_month = OLD.year_month AND days = 0;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_daily_usage_rollup_delete
+    AFTER DELETE ON daily_usage
+    BEGIN
+        UPDATE monthly_rollup SET
+            total_kwh = total_kwh - OLD.consumption_kwh,
+            total_cost = total_cost - OLD.cost,
+            days = days - 1
+        WHERE user_id = OLD.user_id AND year_month = OLD.year_month;
+        DELETE FROM monthly_rollup
+        WHERE user_id = OLD.user_id AND year_month = OLD.year_month AND days = 0;
+    END
+    """,
+)
+
+# LIMIT has to apply before AVG, so the 30 most recent days are picked in a
+# subquery; it walks the (user_id, date) index backwards and stops after 30 rows
+SQL_AVG_DAILY_KWH = """
+    SELECT COALESCE(AVG(consumption_kwh), 0) as avg_daily
+    FROM (
+        SELECT consumption_kwh
+        FROM daily_usage
+        WHERE user_id = ?
+        ORDER BY date DESC
+        LIMIT 30
+    )
+"""
+
+SQL_MONTH_KWH = """
+    SELECT COALESCE(SUM(consumption_kwh), 0) as current_kwh
+    FROM daily_usage
+    WHERE user_id = ? AND date >= ? AND date < ?
+"""
+
+# Dashboard in one statement: the 30 most recent days, each carrying the raw
+# 30-day average (window over the limited rows) and the current month's total
+SQL_DASHBOARD = """
+    SELECT date, consumption_kwh, cost,
+        COALESCE(is_anomaly, 0) as "is_anomaly [boolean]", readings_count,
+        AVG(consumption_kwh) OVER () as avg_daily,
+        (SELECT COALESCE(SUM(consumption_kwh), 0) FROM daily_usage
+         WHERE user_id = ?1 AND date >= ?2 AND date < ?3) as current_kwh
+    FROM (
+        SELECT * FROM daily_usage
+        WHERE user_id = ?1
+        ORDER BY date DESC
+        LIMIT 30
+    )
+    ORDER BY date DESC
+"""
+
+# Weekly digest sums over the 14 most recent days: rn 1-7 is this week, 8-14 the
+# week before
+SQL_WEEKLY_DIGEST = """
+    SELECT
+        COUNT(*) FILTER (WHERE rn <= 7),
+        COALESCE(SUM(kwh) FILTER (WHERE rn <= 7), 0),
+        COALESCE(SUM(cost) FILTER (WHERE rn <= 7), 0),
+        COALESCE(SUM(is_anomaly) FILTER (WHERE rn <= 7), 0),
+        COUNT(*) FILTER (WHERE rn > 7),
+        COALESCE(SUM(kwh) FILTER (WHERE rn > 7), 0)
+    FROM (
+        SELECT consumption_kwh as kwh, cost,
+            COALESCE(is_anomaly, 0) as is_anomaly,
+            ROW_NUMBER() OVER (ORDER BY date DESC) as rn
+        FROM daily_usage
+        WHERE user_id = ?
+        ORDER BY date DESC
+        LIMIT 14
+    )
+"""
+
+SQL_USAGE_PATTERNS = """
+    SELECT
+        CASE WHEN is_weekend THEN 'weekend' ELSE 'weekday' END as day_type,
+        AVG(consumption_kwh) as avg_kwh,
+        COUNT(*) as count
+    FROM daily_usage
+    WHERE user_id = ?
+    GROUP BY is_weekend
+"""
+
+# The CAST matters for RETURNING, which hands back a whole-number REAL
+# default such as 8.0 as the integer 8
+SETTINGS_COLUMNS = """
+    user_id, CAST(electricity_rate AS REAL) as electricity_rate,
+    notifications_enabled as "notifications_enabled [boolean]",
+    weekly_digest_enabled as "weekly_digest_enabled [boolean]",
+    theme
+"""
+
+SQL_GET_SETTINGS = f"SELECT {SETTINGS_COLUMNS} FROM user_settings WHERE user_id = ?"
+
+# Creates the defaults and returns them in the same statement; returns no row
+# if another request created them first
+SQL_INSERT_DEFAULT_SETTINGS = f"""
+    INSERT INTO user_settings (user_id) VALUES (?)
+    ON CONFLICT(user_id) DO NOTHING
+    RETURNING {SETTINGS_COLUMNS}
+"""
+
+SQL_SAVE_SETTINGS = """
+    INSERT INTO user_settings
+    (user_id, electricity_rate, notifications_enabled, weekly_digest_enabled, theme)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        electricity_rate = excluded.electricity_rate,
+        notifications_enabled = excluded.notifications_enabled,
+        weekly_digest_enabled = excluded.weekly_digest_enabled,
+        theme = excluded.theme
+"""
+
+SQL_SAVE_BILLING_CYCLE = """
+    INSERT INTO billing_cycles
+    (user_id, last_bill_date, last_bill_reading, last_bill_amount, billing_period_months)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        last_bill_date = excluded.last_bill_date,
+        last_bill_reading = excluded.last_bill_reading,
+        last_bill_amount = excluded.last_bill_amount,
+        billing_period_months = excluded.billing_period_months,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+SQL_GET_BILLING_CYCLE = """
+    SELECT * FROM billing_cycles WHERE user_id = ?
+"""
+
+SQL_CYCLE_LATEST_READING = """
+    SELECT
+        (SELECT MAX(reading_kwh) FROM readings WHERE user_id = ? AND date >= ?),
+        EXISTS(SELECT 1 FROM readings WHERE user_id = ?)
+"""
+
+SQL_SAVE_BUDGET = """
+    INSERT INTO user_budgets
+    (user_id, monthly_kwh_goal, monthly_cost_goal, alert_threshold, updated_at)
+    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(user_id) DO UPDATE SET
+        monthly_kwh_goal = excluded.monthly_kwh_goal,
+        monthly_cost_goal = excluded.monthly_cost_goal,
+        alert_threshold = excluded.alert_threshold,
+        updated_at = excluded.updated_at
+"""
+
+SQL_GET_BUDGET = """
+    SELECT monthly_kwh_goal, monthly_cost_goal, alert_threshold,
+        (SELECT COALESCE(SUM(consumption_kwh), 0) FROM daily_usage
+         WHERE user_id = b.user_id AND date >= ? AND date < ?) as current_kwh
+    FROM user_budgets b WHERE user_id = ?
+"""
+
+class DailyUsageColumns(NamedTuple):
+    """Daily usage as parallel columns (newest first), one tuple per field."""
+    date: tuple
+    consumption_kwh: tuple
+    cost: tuple
+    is_anomaly: tuple
+    readings_count: tuple
+
+def _month_range(year: int, month: int):
+    """Half-open [start, end) ISO date bounds for a month, usable as an index range."""
+    start = f"{year}-{month:02d}-01"
+    end = f"{year + 1}-01-01" if month == 12 else f"{year}-{month + 1:02d}-01"
+    return start, end
+
+def _reading_params(reading: Dict, user_id: str) -> tuple:
+    return (
+        user_id,
+        reading.get("date"),
+        reading.get("time_of_day"),
+        reading.get("reading_kwh")
+    )
+
+def _daily_usage_params(usage: Dict, user_id: str) -> tuple:
+    return (
+        user_id,
+        usage.get("date"),
+        usage.get("consumption_kwh"),
+        usage.get("cost"),
+        1 if usage.get("is_anomaly") else 0,
+        usage.get("readings_count", 0)
+    )
+
 class Database:
     def __init__(self, db_file: str = DB_FILE):
         self.db_file = db_file
+        self._pool = queue.Queue(maxsize=POOL_SIZE)
+        # Read-only handles for SELECT-only methods; under WAL they never
+        # contend with the writer and need no commit
+        self._ro_pool = queue.Queue(maxsize=POOL_SIZE)
+        self._all_connections = set()
+        self._pool_lock = threading.RLock()
+        self._cache = OrderedDict()  # (kind, user_id) -> (stored_at, value), in LRU order
+        self._cache_gens = {}  # (kind, user_id) -> invalidation count, to reject stale puts
+        self._cache_lock = threading.Lock()
+        # Connection this thread currently holds, so nested calls join its transaction
+        self._tls = threading.local()
+        for _ in range(POOL_SIZE):
+            self._pool.put(self._create_connection())
         self._init_db()
         self._migrate_from_json()
+        # The file has to exist before it can be opened read-only
+        for _ in range(POOL_SIZE):
+            self._ro_pool.put(self._create_connection(read_only=True))
+
+        self._stop_maintenance = threading.Event()
+        self._maintenance = threading.Thread(target=self._maintenance_loop, daemon=True)
+        self._maintenance.start()
+
+    def _create_connection(self, read_only: bool = False) -> sqlite3.Connection:
+        if read_only:
+            uri = pathlib.Path(self.db_file).resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=256,
+                                   detect_types=sqlite3.PARSE_COLNAMES)
+        else:
+            conn = sqlite3.connect(self.db_file, check_same_thread=False, cached_statements=256,
+                                   detect_types=sqlite3.PARSE_COLNAMES)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        with self._pool_lock:
+            self._all_connections.add(conn)
+        return conn
+
+    def _checkout(self, pool: queue.Queue, read_only: bool = False) -> sqlite3.Connection:
+        """Take a connection from the pool, replacing it if it no longer answers."""
+        conn = pool.get(timeout=POOL_TIMEOUT)
+        try:
+            conn.execute(SQL_PING)
+        except sqlite3.Error:
+            with self._pool_lock:
+                self._all_connections.discard(conn)
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            try:
+                conn = self._create_connection(read_only)
+            except Exception:
+                pool.put_nowait(conn)  # Keep the pool at full size for the next caller
+                raise
+        return conn
 
     @contextmanager
     def _get_connection(self):
-        """Context manager for database connections."""
-        conn = sqlite3.connect(self.db_file)
-        conn.row_factory = sqlite3.Row
+        """Context manager that borrows a pooled connection for one transaction.
+
+        Nested calls on the same thread reuse the outer connection; only the
+        outermost block commits and returns it to the pool.
+        """
+        conn = getattr(self._tls, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self._checkout(self._pool)
+        self._tls.conn = conn
+        self._tls.pending_invalidations = []
         try:
             yield conn
             conn.commit()
@@ -29,11 +474,127 @@ class Database:
             conn.rollback()
             raise
         finally:
-            conn.close()
+            self._tls.conn = None
+            pending, self._tls.pending_invalidations = self._tls.pending_invalidations, None
+            self._pool.put(conn)
+            # Another thread may have re-cached pre-commit rows mid-transaction,
+            # or this one uncommitted rows before a rollback
+            for kind, user_id in pending:
+                self._cache_invalidate(kind, user_id)
+
+    def run_in_transaction(self, fn, *args):
+        """Call fn(self, *args) with every database call it makes sharing one transaction."""
+        with self._get_connection():
+            return fn(self, *args)
+
+    @contextmanager
+    def _get_ro_connection(self):
+        """Context manager that borrows a pooled read-only connection."""
+        conn = getattr(self._tls, "conn", None)
+        if conn is not None:
+            # Inside a write: read through it to see its uncommitted changes
+            yield conn
+            return
+
+        conn = self._checkout(self._ro_pool, read_only=True)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._ro_pool.put(conn)
+
+    def _cache_get(self, kind: str, user_id: str):
+        """(cached value or _MISSING, generation); pass the generation to _cache_put."""
+        key = (kind, user_id)
+        with self._cache_lock:
+            generation = self._cache_gens.get(key, 0)
+            entry = self._cache.get(key)
+            if entry is None:
+                return _MISSING, generation
+            if time.monotonic() - entry[0] >= CACHE_TTL:
+                del self._cache[key]
+                return _MISSING, generation
+            self._cache.move_to_end(key)
+            return entry[1], generation
+
+    def _cache_put(self, kind: str, user_id: str, value, generation: int):
+        """Cache a value read after _cache_get returned generation.
+
+        Dropped if the key was invalidated since: the value may predate that write.
+        """
+        key = (kind, user_id)
+        with self._cache_lock:
+            if self._cache_gens.get(key, 0) != generation:
+                return
+            self._cache[key] = (time.monotonic(), value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > CACHE_MAX_SIZE:
+                self._cache.popitem(last=False)
+
+    def _cache_invalidate(self, kind: str, user_id: str):
+        key = (kind, user_id)
+        with self._cache_lock:
+            self._cache.pop(key, None)
+            self._cache_gens[key] = self._cache_gens.get(key, 0) + 1
+        pending = getattr(self._tls, "pending_invalidations", None)
+        if pending is not None:
+            pending.append((kind, user_id))
+
+    def _maintenance_loop(self):
+        runs = 0
+        while not self._stop_maintenance.wait(MAINTENANCE_INTERVAL):
+            runs += 1
+            try:
+                with self._get_connection() as conn:
+                    conn.execute("PRAGMA optimize")
+                    if runs % CHECKPOINT_EVERY == 0:
+                        conn.commit()  # A checkpoint can't run inside a transaction
+                        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except Exception as e:
+                print(f"Database maintenance error: {e}")
+
+    def pool_status(self) -> Dict:
+        """Pool occupancy for monitoring, plus a ping through a read-only connection."""
+        status = {
+            "pool_size": POOL_SIZE,
+            "idle_write": self._pool.qsize(),
+            "idle_read": self._ro_pool.qsize(),
+            "open_connections": len(self._all_connections),
+        }
+        try:
+            with self._get_ro_connection() as conn:
+                conn.execute(SQL_PING)
+            status["healthy"] = True
+        except (sqlite3.Error, queue.Empty) as e:
+            status["healthy"] = False
+            status["error"] = str(e)
+        return status
+
+    def close(self):
+        """Stop background maintenance and close every pooled connection."""
+        self._stop_maintenance.set()
+        with self._pool_lock:
+            for pool in (self._pool, self._ro_pool):
+                while True:
+                    try:
+                        pool.get_nowait()
+                    except queue.Empty:
+                        break
+            for conn in self._all_connections:
+                try:
+                    # Recommended before closing: persist stats for the next start
+                    conn.execute("PRAGMA optimize")
+                except sqlite3.Error:
+                    pass
+                conn.close()
+            self._all_connections.clear()
 
     def _init_db(self):
         """Initialize database schema."""
         with self._get_connection() as conn:
+            # WAL lets readers run alongside a writer and needs fewer fsyncs per commit
+            conn.execute("PRAGMA journal_mode=WAL")
             cursor = conn.cursor()
             
             # Users table (for future expansion)
@@ -60,24 +621,35 @@ class Database:
                 )
             """)
             
+            # Readings and daily usage are always looked up by their natural key,
+            # so they are WITHOUT ROWID tables clustered on it: one b-tree per
+            # table instead of a rowid table plus a UNIQUE index. Databases
+            # created with the older rowid layout are moved aside and copied over.
+            moved_readings = self._move_rowid_table(cursor, "readings")
+            
             # Meter readings table
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS readings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
                     user_id TEXT NOT NULL,
                     date TEXT NOT NULL,
                     time_of_day TEXT NOT NULL CHECK(time_of_day IN ('morning', 'night')),
                     reading_kwh REAL NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(user_id, date, time_of_day),
+                    PRIMARY KEY (user_id, date, time_of_day),
                     FOREIGN KEY (user_id) REFERENCES users(id)
-                )
+                ) WITHOUT ROWID
             """)
+            if moved_readings:
+                self._copy_rowid_table(cursor, "readings",
+                                       "user_id, date, time_of_day, reading_kwh, created_at")
+            
+            moved_daily_usage = self._move_rowid_table(cursor, "daily_usage")
             
-            # Daily usage table
+            # Daily usage table. is_weekend (strftime's %w is 0=Sunday, 6=Saturday)
+            # and year_month (yyyymm, e.g. 202403) are derived from the date on
+            # write, so queries group on stored values instead of parsing dates.
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS daily_usage (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
                     user_id TEXT NOT NULL,
                     date TEXT NOT NULL,
                     consumption_kwh REAL NOT NULL,
@@ -85,10 +657,17 @@ class Database:
                     is_anomaly INTEGER DEFAULT 0,
                     readings_count INTEGER DEFAULT 0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(user_id, date),
+                    is_weekend INTEGER
+                        GENERATED ALWAYS AS (COALESCE(strftime('%w', date) IN ('0', '6'), 0)) VIRTUAL,
+                    year_month INTEGER
+                        GENERATED ALWAYS AS (CAST(substr(date, 1, 4) || substr(date, 6, 2) AS INTEGER)) VIRTUAL,
+                    PRIMARY KEY (user_id, date),
                     FOREIGN KEY (user_id) REFERENCES users(id)
-                )
+                ) WITHOUT ROWID
             """)
+            if moved_daily_usage:
+                self._copy_rowid_table(cursor, "daily_usage",
+                                       "user_id, date, consumption_kwh, cost, is_anomaly, readings_count, created_at")
             
             # User settings table
             cursor.execute("""
@@ -129,82 +708,166 @@ class Database:
             
             # Create indexes for performance
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_appliances_user ON appliances(user_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_readings_user ON readings(user_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_readings_date ON readings(date)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_usage_user ON daily_usage(user_id)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_usage_date ON daily_usage(date)")
+            # readings and daily_usage are clustered on (user_id, date, ...), which
+            # serves every user/date range query straight from the table b-tree;
+            # the single-column and covering indexes only slowed down writes
+            for index in ("idx_readings_user", "idx_readings_date",
+                          "idx_daily_usage_user", "idx_daily_usage_date",
+                          "idx_daily_usage_cover"):
+                cursor.execute(f"DROP INDEX IF EXISTS {index}")
+            # Matches get_readings' "date DESC, time_of_day" order so the list
+            # and the billing-cycle MAX are read in index order, without a sort
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_readings_cover ON readings
+                (user_id, date DESC, time_of_day, reading_kwh)
+            """)
+            # The index stores the computed weekend flag, so the weekday/weekend
+            # split groups on it instead of formatting every date per query.
+            # date comes before consumption_kwh so each group's AVG adds its rows
+            # in date order, as the table scan did; summing in another order can
+            # move the rounded average by a cent. Replaces idx_daily_usage_weekend
+            cursor.execute("DROP INDEX IF EXISTS idx_daily_usage_weekend")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_daily_usage_weekend_date ON daily_usage
+                (user_id, is_weekend, date, consumption_kwh)
+            """)
+            # The yearly summary reads monthly_rollup now, so this index only cost writes
+            cursor.execute("DROP INDEX IF EXISTS idx_daily_usage_month")
+
+            # Per-month totals maintained by triggers, so a year is 12 row lookups
+            # however long the daily history gets
+            has_rollup = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'monthly_rollup'"
+            ).fetchone() is not None
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS monthly_rollup (
+                    user_id TEXT NOT NULL,
+                    year_month INTEGER NOT NULL,
+                    total_kwh REAL NOT NULL DEFAULT 0,
+                    total_cost REAL NOT NULL DEFAULT 0,
+                    days INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, year_month)
+                ) WITHOUT ROWID
+            """)
+            if not has_rollup:
+                # Backfill from the existing history once
+                cursor.execute("""
+                    INSERT INTO monthly_rollup (user_id, year_month, total_kwh, total_cost, days)
+                    SELECT user_id, year_month, SUM(consumption_kwh), SUM(cost), COUNT(*)
+                    FROM daily_usage
+                    GROUP BY user_id, year_month
+                """)
+            for trigger in SQL_ROLLUP_TRIGGERS:
+                cursor.execute(trigger)
+            # Refresh planner statistics so the composite indexes get picked
+            cursor.execute("ANALYZE")
+
+    @staticmethod
+    def _move_rowid_table(cursor: sqlite3.Cursor, table: str) -> bool:
+        """Rename a table still using the old rowid layout out of the way; True if moved."""
+        row = cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        if row is None or "WITHOUT ROWID" in row[0].upper():
+            return False
+        # Its indexes and triggers move with it and are dropped along with it
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_rowid")
+        return True
+
+    @staticmethod
+    def _copy_rowid_table(cursor: sqlite3.Cursor, table: str, columns: str):
+        cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {table}_rowid")
+        cursor.execute(f"DROP TABLE {table}_rowid")
+
+    @staticmethod
+    def _has_data(conn: sqlite3.Connection) -> bool:
+        # Stops at the first row instead of counting the whole table
+        return conn.execute(SQL_HAS_APPLIANCES).fetchone() is not None
 
     def _migrate_from_json(self):
         """Migrate existing data from db.json to SQLite."""
         json_file = "db.json"
         if not os.path.exists(json_file):
             return
-        
+
+        # Don't parse a leftover db.json when the store is already populated
+        with self._get_connection() as conn:
+            if self._has_data(conn):
+                return
+
         try:
-            with open(json_file, 'r') as f:
-                data = json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return
+            # Parse straight from a read-only mapping rather than a copied str
+            with open(json_file, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    view = memoryview(mm)
+                    try:
+                        data = orjson.loads(view)
+                    finally:
+                        view.release()
+        except (orjson.JSONDecodeError, ValueError, OSError):
+            return  # Missing, empty or malformed file
         
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Check if already migrated
-            cursor.execute("SELECT COUNT(*) FROM appliances")
-            if cursor.fetchone()[0] > 0:
-                return  # Already has data
-            
-            # Migrate appliances
-            for app in data.get("appliances", []):
-                try:
-                    cursor.execute("""
-                        INSERT OR IGNORE INTO appliances 
-                        (id, user_id, name, power_rating_watts, usage_duration_hours_per_day)
-                        VALUES (?, ?, ?, ?, ?)
-                    """, (
+        try:
+            with self._get_connection() as conn:
+                # Hold the write lock for the whole migration so it lands as one transaction
+                conn.execute("BEGIN IMMEDIATE")
+                # Re-check under the lock in case another process migrated first
+                if self._has_data(conn):
+                    return  # Already has data
+
+                cursor = conn.cursor()
+                cursor.row_factory = None
+
+                # INSERT OR IGNORE skips conflicting or incomplete rows
+                cursor.executemany("""
+                    INSERT OR IGNORE INTO appliances
+                    (id, user_id, name, power_rating_watts, usage_duration_hours_per_day)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (
+                    (
                         app.get("id"),
                         app.get("userId", "default"),
                         app.get("name"),
                         app.get("power_rating_watts"),
                         app.get("usage_duration_hours_per_day")
-                    ))
-                except Exception:
-                    pass
-            
-            # Migrate readings
-            for reading in data.get("readings", []):
-                try:
-                    cursor.execute("""
-                        INSERT OR IGNORE INTO readings 
-                        (user_id, date, time_of_day, reading_kwh)
-                        VALUES (?, ?, ?, ?)
-                    """, (
+                    )
+                    for app in data.get("appliances", [])
+                ))
+
+                cursor.executemany("""
+                    INSERT OR IGNORE INTO readings
+                    (user_id, date, time_of_day, reading_kwh)
+                    VALUES (?, ?, ?, ?)
+                """, (
+                    (
                         reading.get("userId", "default"),
                         reading.get("date"),
                         reading.get("time_of_day"),
                         reading.get("reading_kwh")
-                    ))
-                except Exception:
-                    pass
-            
-            # Migrate daily usage
-            for usage in data.get("daily_usage", []):
-                try:
-                    cursor.execute("""
-                        INSERT OR IGNORE INTO daily_usage 
-                        (user_id, date, consumption_kwh, cost, is_anomaly, readings_count)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (
+                    )
+                    for reading in data.get("readings", [])
+                ))
+
+                cursor.executemany("""
+                    INSERT OR IGNORE INTO daily_usage
+                    (user_id, date, consumption_kwh, cost, is_anomaly, readings_count)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (
+                    (
                         usage.get("userId", "default"),
                         usage.get("date"),
                         usage.get("consumption_kwh"),
                         usage.get("cost"),
                         1 if usage.get("is_anomaly") else 0,
                         usage.get("readings_count", 0)
-                    ))
-                except Exception:
-                    pass
-        
+                    )
+                    for usage in data.get("daily_usage", [])
+                ))
+        except (sqlite3.Error, AttributeError) as e:
+            # Keep db.json in place so the migration can be retried
+            print(f"JSON migration failed: {e}")
+            return
+
         # Rename old file to backup
         try:
             os.rename(json_file, "db.json.backup")
@@ -214,23 +877,15 @@ class Database:
     # ==================== APPLIANCES ====================
     
     def get_appliances(self, user_id: str) -> List[Dict]:
-        with self._get_connection() as conn:
+        with self._get_ro_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, name, power_rating_watts, usage_duration_hours_per_day, category
-                FROM appliances WHERE user_id = ?
-                ORDER BY created_at DESC
-            """, (user_id,))
-            return [dict(row) for row in cursor.fetchall()]
+            cursor.execute(SQL_GET_APPLIANCES, (user_id,))
+            return [dict(zip(APPLIANCE_KEYS, row)) for row in cursor.fetchall()]
 
     def add_appliance(self, appliance: Dict, user_id: str):
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO appliances 
-                (id, user_id, name, power_rating_watts, usage_duration_hours_per_day, category)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
+            cursor.execute(SQL_ADD_APPLIANCE, (
                 appliance.get("id"),
                 user_id,
                 appliance.get("name"),
@@ -242,181 +897,214 @@ class Database:
     def delete_appliance(self, app_id: str, user_id: str):
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(
-                "DELETE FROM appliances WHERE id = ? AND user_id = ?",
-                (app_id, user_id)
-            )
+            cursor.execute(SQL_DELETE_APPLIANCE, (app_id, user_id))
 
     # ==================== READINGS ====================
     
     def get_readings(self, user_id: str) -> List[Dict]:
-        with self._get_connection() as conn:
+        with self._get_ro_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT date, time_of_day, reading_kwh
-                FROM readings WHERE user_id = ?
-                ORDER BY date DESC, time_of_day
-            """, (user_id,))
-            return [dict(row) for row in cursor.fetchall()]
+            cursor.execute(SQL_GET_READINGS, (user_id,))
+            return [dict(zip(READING_KEYS, row)) for row in cursor.fetchall()]
+
+    def get_readings_for_date(self, user_id: str, date: str) -> List[Dict]:
+        """Get the (at most two) readings of one day, via the primary key."""
+        with self._get_ro_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_GET_READINGS_FOR_DATE, (user_id, str(date)))
+            return [dict(zip(READING_KEYS, row)) for row in cursor.fetchall()]
 
-    def add_reading(self, reading: Dict, user_id: str):
+    def add_reading(self, reading: Dict, user_id: str) -> List[Dict]:
+        """Save a reading and return that day's readings, read back in the same transaction."""
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                INSERT OR REPLACE INTO readings 
-                (user_id, date, time_of_day, reading_kwh)
-                VALUES (?, ?, ?, ?)
-            """, (
-                user_id,
-                reading.get("date"),
-                reading.get("time_of_day"),
-                reading.get("reading_kwh")
-            ))
+            cursor.execute(SQL_ADD_READING, _reading_params(reading, user_id))
+            cursor.execute(SQL_GET_READINGS_FOR_DATE, (user_id, str(reading["date"])))
+            return [dict(zip(READING_KEYS, row)) for row in cursor.fetchall()]
+
+    def _executemany_batched(self, sql: str, params: Iterable[tuple]):
+        """executemany in BULK_BATCH_SIZE chunks, one transaction per chunk."""
+        params = iter(params)
+        while True:
+            batch = list(itertools.islice(params, BULK_BATCH_SIZE))
+            if not batch:
+                return
+            with self._get_connection() as conn:
+                # Take the write lock up front rather than upgrading mid-batch
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(sql, batch)
+
+    def add_readings_bulk(self, readings: Iterable[Dict], user_id: str):
+        """Add or overwrite many readings, committed in batches."""
+        self._executemany_batched(SQL_ADD_READING, (_reading_params(r, user_id) for r in readings))
     
     def get_reading_by_date_time(self, user_id: str, date: str, time_of_day: str) -> Optional[Dict]:
         """Get a specific reading by date and time of day."""
-        with self._get_connection() as conn:
+        with self._get_ro_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT date, time_of_day, reading_kwh
-                FROM readings 
-                WHERE user_id = ? AND date = ? AND time_of_day = ?
-            """, (user_id, date, time_of_day))
+            cursor.execute(SQL_GET_READING, (user_id, date, time_of_day))
             row = cursor.fetchone()
-            return dict(row) if row else None
+            return dict(zip(READING_KEYS, row)) if row else None
     
     def update_reading(self, user_id: str, date: str, time_of_day: str, new_reading_kwh: float):
         """Update an existing reading."""
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE readings 
-                SET reading_kwh = ?
-                WHERE user_id = ? AND date = ? AND time_of_day = ?
-            """, (new_reading_kwh, user_id, date, time_of_day))
+            cursor.execute(SQL_UPDATE_READING, (new_reading_kwh, user_id, date, time_of_day))
             return cursor.rowcount > 0
 
+    def replace_reading(self, user_id: str, date: str, time_of_day: str,
+                        new_reading_kwh: float) -> Optional[Tuple[Dict, List[Dict]]]:
+        """Update a reading in one transaction.
+
+        Returns (the reading as it was, the day's readings after the update), or
+        None if there is no such reading.
+        """
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(SQL_GET_READING, (user_id, date, time_of_day))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            cursor.execute(SQL_UPDATE_READING, (new_reading_kwh, user_id, date, time_of_day))
+            cursor.execute(SQL_GET_READINGS_FOR_DATE, (user_id, date))
+            return dict(zip(READING_KEYS, row)), [dict(zip(READING_KEYS, r)) for r in cursor.fetchall()]
+
     # ==================== DAILY USAGE ====================
     
-    def get_daily_usage(self, user_id: str, limit: int = 100) -> List[Dict]:
-        with self._get_connection() as conn:
+    def _daily_usage_rows(self, user_id: str, limit: int) -> List[tuple]:
+        """Most recent rows as tuples, cached per user and limit until the user's next daily usage write."""
+        cached, generation = self._cache_get("daily_usage", user_id)
+        if cached is not _MISSING and limit in cached:
+            return cached[limit]
+
+        with self._get_ro_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT date, consumption_kwh, cost, is_anomaly, readings_count
-                FROM daily_usage WHERE user_id = ?
-                ORDER BY date DESC
-                LIMIT ?
-            """, (user_id, limit))
+            cursor.row_factory = None
+            cursor.execute(SQL_GET_DAILY_USAGE, (user_id, limit))
             rows = cursor.fetchall()
-            return [
-                {
-                    "date": row["date"],
-                    "consumption_kwh": row["consumption_kwh"],
-                    "cost": row["cost"],
-                    "is_anomaly": bool(row["is_anomaly"]),
-                    "readings_count": row["readings_count"]
-                }
-                for row in rows
-            ]
+
+        by_limit = {} if cached is _MISSING else cached
+        self._cache_put("daily_usage", user_id, {**by_limit, limit: rows}, generation)
+        return rows
+
+    def get_daily_usage(self, user_id: str, limit: int = 100) -> List[Dict]:
+        # Fresh dicts per call, so callers can't alter the cached rows
+        return [dict(zip(DAILY_USAGE_KEYS, row)) for row in self._daily_usage_rows(user_id, limit)]
+
+    def get_daily_usage_columns(self, user_id: str, limit: int = 100) -> DailyUsageColumns:
+        """Same rows as get_daily_usage, transposed into columns for aggregation."""
+        rows = self._daily_usage_rows(user_id, limit)
+        if not rows:
+            return DailyUsageColumns((), (), (), (), ())
+        return DailyUsageColumns(*zip(*rows))
+
+    def get_daily_usage_page(self, user_id: str, before: Optional[str] = None,
+                             limit: int = 100) -> List[tuple]:
+        """One page of rows as plain tuples in DAILY_USAGE_KEYS order, newest first.
+
+        Pass the last date of the previous page as `before` to continue. For
+        callers that reformat every row anyway (e.g. CSV export); no dict is
+        built per row.
+        """
+        with self._get_ro_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            if before is None:
+                cursor.execute(SQL_GET_DAILY_USAGE, (user_id, limit))
+            else:
+                cursor.execute(SQL_GET_DAILY_USAGE_BEFORE, (user_id, before, limit))
+            return cursor.fetchall()
 
     def save_daily_usage(self, usage: Dict, user_id: str):
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                INSERT OR REPLACE INTO daily_usage 
-                (user_id, date, consumption_kwh, cost, is_anomaly, readings_count)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
-                user_id,
-                usage.get("date"),
-                usage.get("consumption_kwh"),
-                usage.get("cost"),
-                1 if usage.get("is_anomaly") else 0,
-                usage.get("readings_count", 0)
-            ))
+            cursor.execute(SQL_SAVE_DAILY_USAGE, _daily_usage_params(usage, user_id))
+        self._cache_invalidate("daily_usage", user_id)
+
+    def save_daily_usage_bulk(self, usages: Iterable[Dict], user_id: str):
+        """Save many days, committed in batches; existing days are overwritten."""
+        self._executemany_batched(SQL_SAVE_DAILY_USAGE, (_daily_usage_params(u, user_id) for u in usages))
+        self._cache_invalidate("daily_usage", user_id)
 
     # ==================== REPORTS & ANALYTICS ====================
     
     def get_monthly_report(self, user_id: str, year: int, month: int) -> Dict:
         """Get monthly usage statistics."""
         month_str = f"{year}-{month:02d}"
+        month_range = _month_range(year, month)
         
-        with self._get_connection() as conn:
+        with self._get_ro_connection() as conn:
             cursor = conn.cursor()
             
-            # Get daily data for the month
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as days_recorded,
-                    SUM(consumption_kwh) as total_kwh,
-                    SUM(cost) as total_cost,
-                    AVG(consumption_kwh) as avg_daily_kwh,
-                    MAX(consumption_kwh) as peak_kwh,
-                    MIN(consumption_kwh) as min_kwh,
-                    SUM(CASE WHEN is_anomaly = 1 THEN 1 ELSE 0 END) as anomaly_days
-                FROM daily_usage 
-                WHERE user_id = ? AND date LIKE ?
-            """, (user_id, f"{month_str}%"))
-            
-            stats = dict(cursor.fetchone())
+            # One scan of the month; the stats are derived from the same rows
+            cursor.execute(SQL_MONTHLY_DAILY, (user_id, *month_range))
             
-            # Get daily breakdown
-            cursor.execute("""
-                SELECT date, consumption_kwh, cost, is_anomaly
-                FROM daily_usage 
-                WHERE user_id = ? AND date LIKE ?
-                ORDER BY date
-            """, (user_id, f"{month_str}%"))
-            
-            daily_data = [
-                {
-                    "date": row["date"],
-                    "consumption_kwh": row["consumption_kwh"],
-                    "cost": row["cost"],
-                    "is_anomaly": bool(row["is_anomaly"])
-                }
-                for row in cursor.fetchall()
-            ]
+            daily_data = []
+            total_kwh = total_cost = 0
+            peak_kwh = min_kwh = None
+            anomaly_days = 0
+            # Single pass over the rows for the breakdown and every stat
+            for row in cursor.fetchall():
+                day = dict(zip(MONTHLY_DAILY_KEYS, row))
+                daily_data.append(day)
+                kwh = day["consumption_kwh"]
+                total_kwh += kwh
+                total_cost += day["cost"]
+                if peak_kwh is None or kwh > peak_kwh:
+                    peak_kwh = kwh
+                if min_kwh is None or kwh < min_kwh:
+                    min_kwh = kwh
+                anomaly_days += day["is_anomaly"]
+            days_recorded = len(daily_data)
             
             return {
                 "month": month_str,
                 "stats": {
-                    "days_recorded": stats["days_recorded"] or 0,
-                    "total_kwh": round(stats["total_kwh"] or 0, 2),
-                    "total_cost": round(stats["total_cost"] or 0, 2),
-                    "avg_daily_kwh": round(stats["avg_daily_kwh"] or 0, 2),
-                    "peak_kwh": round(stats["peak_kwh"] or 0, 2),
-                    "min_kwh": round(stats["min_kwh"] or 0, 2),
-                    "anomaly_days": stats["anomaly_days"] or 0
+                    "days_recorded": days_recorded,
+                    "total_kwh": round(total_kwh, 2),
+                    "total_cost": round(total_cost, 2),
+                    "avg_daily_kwh": round(total_kwh / days_recorded, 2) if days_recorded else 0,
+                    "peak_kwh": round(peak_kwh or 0, 2),
+                    "min_kwh": round(min_kwh or 0, 2),
+                    "anomaly_days": anomaly_days
                 },
                 "daily_data": daily_data
             }
 
+    def get_monthly_totals(self, user_id: str, start_year: int, start_month: int,
+                           end_year: int, end_month: int) -> Dict[str, Dict]:
+        """Rolled-up kWh, cost and days per "YYYY-MM" in a range of months; months without data are absent."""
+        with self._get_ro_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(SQL_MONTH_TOTALS, (user_id, start_year * 100 + start_month, end_year * 100 + end_month))
+            return {
+                f"{year_month // 100}-{year_month % 100:02d}": {
+                    "total_kwh": round(total_kwh, 2),
+                    "total_cost": round(total_cost, 2),
+                    "days_recorded": days
+                }
+                for year_month, total_kwh, total_cost, days in cursor.fetchall()
+            }
+
     def get_yearly_summary(self, user_id: str, year: int) -> Dict:
         """Get yearly usage summary by month."""
-        with self._get_connection() as conn:
+        with self._get_ro_connection() as conn:
             cursor = conn.cursor()
             
-            cursor.execute("""
-                SELECT 
-                    strftime('%m', date) as month,
-                    SUM(consumption_kwh) as total_kwh,
-                    SUM(cost) as total_cost,
-                    COUNT(*) as days_recorded
-                FROM daily_usage 
-                WHERE user_id = ? AND date LIKE ?
-                GROUP BY strftime('%m', date)
-                ORDER BY month
-            """, (user_id, f"{year}%"))
+            cursor.row_factory = None
+            cursor.execute(SQL_YEARLY_BY_MONTH, (user_id, year * 100 + 1, year * 100 + 12))
             
             monthly_data = [
                 {
-                    "month": int(row["month"]),
-                    "total_kwh": round(row["total_kwh"] or 0, 2),
-                    "total_cost": round(row["total_cost"] or 0, 2),
-                    "days_recorded": row["days_recorded"]
+                    "month": month,
+                    "total_kwh": round(total_kwh, 2),
+                    "total_cost": round(total_cost, 2),
+                    "days_recorded": days
                 }
-                for row in cursor.fetchall()
+                for month, total_kwh, total_cost, days in cursor.fetchall()
             ]
             
             # Calculate totals
@@ -433,79 +1121,92 @@ class Database:
                 }
             }
 
+    @staticmethod
+    def _bill_prediction(avg_daily: float, current_kwh: float, today: date) -> Dict:
+        """Build the monthly prediction from the 30-day average and month-to-date kWh."""
+        from slab_rates import calculate_monthly_bill, calculate_daily_cost
+        
+        # Project to 30 days and calculate cost using current slab rates
+        predicted_kwh = round(avg_daily * 30, 2)
+        monthly_bill = calculate_monthly_bill(predicted_kwh)
+        predicted_cost = monthly_bill["total_amount"]
+        avg_daily_cost = calculate_daily_cost(avg_daily, predicted_kwh)
+        
+        # Recalculate current month cost using slab rates
+        current_month_bill = calculate_monthly_bill(current_kwh)
+        current_cost = current_month_bill["total_amount"]
+        
+        return {
+            "predicted_monthly_kwh": predicted_kwh,
+            "predicted_monthly_cost": predicted_cost,
+            "avg_daily_kwh": round(avg_daily, 2),
+            "avg_daily_cost": avg_daily_cost,
+            "current_month": {
+                "month": today.isoformat()[:7],
+                "kwh_so_far": round(current_kwh, 2),
+                "cost_so_far": round(current_cost, 2),
+                "days_recorded": today.day
+            }
+        }
+
     def predict_monthly_bill(self, user_id: str) -> Dict:
         """Predict monthly bill based on recent usage patterns."""
-        from slab_rates import calculate_monthly_bill, calculate_daily_cost
+        today = date.today()
         
-        with self._get_connection() as conn:
+        with self._get_ro_connection() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = None  # Scalar queries only; plain tuples suffice
             
             # Get last 30 days of usage (only kWh, we'll recalculate cost)
-            cursor.execute("""
-                SELECT AVG(consumption_kwh) as avg_daily
-                FROM daily_usage 
-                WHERE user_id = ?
-                ORDER BY date DESC
-                LIMIT 30
-            """, (user_id,))
-            
-            result = cursor.fetchone()
-            avg_daily = result["avg_daily"] or 0
-            
-            # Project to 30 days and calculate cost using current slab rates
-            predicted_kwh = round(avg_daily * 30, 2)
-            monthly_bill = calculate_monthly_bill(predicted_kwh)
-            predicted_cost = monthly_bill["total_amount"]
-            avg_daily_cost = calculate_daily_cost(avg_daily, predicted_kwh)
+            cursor.execute(SQL_AVG_DAILY_KWH, (user_id,))
+            (avg_daily,) = cursor.fetchone()
             
             # Get current month progress
-            today = date.today()
-            month_str = today.strftime("%Y-%m")
-            
-            cursor.execute("""
-                SELECT SUM(consumption_kwh) as current_kwh
-                FROM daily_usage 
-                WHERE user_id = ? AND date LIKE ?
-            """, (user_id, f"{month_str}%"))
-            
-            current = cursor.fetchone()
-            current_kwh = current["current_kwh"] or 0
-            
-            # Recalculate current month cost using slab rates
-            current_month_bill = calculate_monthly_bill(current_kwh)
-            current_cost = current_month_bill["total_amount"]
-            
-            return {
-                "predicted_monthly_kwh": predicted_kwh,
-                "predicted_monthly_cost": predicted_cost,
-                "avg_daily_kwh": round(avg_daily, 2),
-                "avg_daily_cost": avg_daily_cost,
-                "current_month": {
-                    "month": month_str,
-                    "kwh_so_far": round(current_kwh, 2),
-                    "cost_so_far": round(current_cost, 2),
-                    "days_recorded": today.day
-                }
-            }
+            cursor.execute(SQL_MONTH_KWH, (user_id, *_month_range(today.year, today.month)))
+            (current_kwh,) = cursor.fetchone()
+        
+        return self._bill_prediction(avg_daily, current_kwh, today)
+
+    def get_weekly_digest_stats(self, user_id: str) -> Dict:
+        """Totals for the last 7 days and kWh for the 7 before, summed in SQLite."""
+        with self._get_ro_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(SQL_WEEKLY_DIGEST, (user_id,))
+            days, total_kwh, total_cost, anomaly_count, prev_days, prev_kwh = cursor.fetchone()
+        
+        return {
+            "days": days,
+            "total_kwh": total_kwh,
+            "total_cost": total_cost,
+            "anomaly_count": anomaly_count,
+            "prev_days": prev_days,
+            "prev_kwh": prev_kwh
+        }
+
+    def get_dashboard_bundle(self, user_id: str) -> Dict:
+        """The 30 most recent daily usage rows plus the bill prediction, in one query."""
+        today = date.today()
+        
+        with self._get_ro_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(SQL_DASHBOARD, (user_id, *_month_range(today.year, today.month)))
+            rows = cursor.fetchall()
+        
+        # No rows means no usage at all, so both aggregates are zero
+        avg_daily, current_kwh = (rows[0][5], rows[0][6]) if rows else (0, 0)
+        return {
+            "daily_usage": [dict(zip(DAILY_USAGE_KEYS, row[:5])) for row in rows],
+            "prediction": self._bill_prediction(avg_daily, current_kwh, today)
+        }
 
     def get_usage_patterns(self, user_id: str) -> Dict:
         """Analyze usage patterns (weekday vs weekend)."""
-        with self._get_connection() as conn:
+        with self._get_ro_connection() as conn:
             cursor = conn.cursor()
             
-            # SQLite uses strftime('%w', date) where 0=Sunday, 6=Saturday
-            cursor.execute("""
-                SELECT 
-                    CASE 
-                        WHEN strftime('%w', date) IN ('0', '6') THEN 'weekend'
-                        ELSE 'weekday'
-                    END as day_type,
-                    AVG(consumption_kwh) as avg_kwh,
-                    COUNT(*) as count
-                FROM daily_usage 
-                WHERE user_id = ?
-                GROUP BY day_type
-            """, (user_id,))
+            cursor.execute(SQL_USAGE_PATTERNS, (user_id,))
             
             patterns = {row["day_type"]: round(row["avg_kwh"] or 0, 2) for row in cursor.fetchall()}
             
@@ -518,44 +1219,34 @@ class Database:
     # ==================== USER SETTINGS ====================
     
     def get_user_settings(self, user_id: str) -> Dict:
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT * FROM user_settings WHERE user_id = ?",
-                (user_id,)
-            )
-            row = cursor.fetchone()
-            
-            if row:
-                return dict(row)
-            
-            # Create default settings
-            cursor.execute("""
-                INSERT INTO user_settings (user_id) VALUES (?)
-            """, (user_id,))
-            
-            return {
-                "user_id": user_id,
-                "electricity_rate": 8.0,
-                "notifications_enabled": True,
-                "weekly_digest_enabled": True,
-                "theme": "dark"
-            }
+        cached, generation = self._cache_get("settings", user_id)
+        if cached is not _MISSING:
+            return dict(cached)
+
+        with self._get_ro_connection() as conn:
+            row = conn.execute(SQL_GET_SETTINGS, (user_id,)).fetchone()
+        
+        if row is None:
+            # First access: only now take the write lock, to store the defaults
+            with self._get_connection() as conn:
+                rows = conn.execute(SQL_INSERT_DEFAULT_SETTINGS, (user_id,)).fetchall()
+                row = rows[0] if rows else conn.execute(SQL_GET_SETTINGS, (user_id,)).fetchone()
+        
+        settings = dict(row)
+        self._cache_put("settings", user_id, settings, generation)
+        return dict(settings)
 
     def update_user_settings(self, user_id: str, settings: Dict):
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                INSERT OR REPLACE INTO user_settings 
-                (user_id, electricity_rate, notifications_enabled, weekly_digest_enabled, theme)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
+            cursor.execute(SQL_SAVE_SETTINGS, (
                 user_id,
                 settings.get("electricity_rate", 8.0),
                 1 if settings.get("notifications_enabled", True) else 0,
                 1 if settings.get("weekly_digest_enabled", True) else 0,
                 settings.get("theme", "dark")
             ))
+        self._cache_invalidate("settings", user_id)
 
     def get_electricity_rate(self, user_id: str) -> float:
         settings = self.get_user_settings(user_id)
@@ -567,27 +1258,26 @@ class Database:
         """Save or update billing cycle information"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                INSERT OR REPLACE INTO billing_cycles 
-                (user_id, last_bill_date, last_bill_reading, last_bill_amount, billing_period_months)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
+            cursor.execute(SQL_SAVE_BILLING_CYCLE, (
                 user_id,
                 cycle_data.get("last_bill_date"),
                 cycle_data.get("last_bill_reading"),
                 cycle_data.get("last_bill_amount"),
                 cycle_data.get("billing_period_months", 2)
             ))
+        self._cache_invalidate("billing_cycle", user_id)
     
     def get_billing_cycle(self, user_id: str) -> Optional[Dict]:
         """Get billing cycle information for user"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT * FROM billing_cycles WHERE user_id = ?
-            """, (user_id,))
-            row = cursor.fetchone()
-            return dict(row) if row else None
+        cycle, generation = self._cache_get("billing_cycle", user_id)
+        if cycle is _MISSING:
+            with self._get_ro_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(SQL_GET_BILLING_CYCLE, (user_id,))
+                row = cursor.fetchone()
+                cycle = dict(row) if row else None
+            self._cache_put("billing_cycle", user_id, cycle, generation)
+        return dict(cycle) if cycle else None
     
     def get_current_cycle_consumption(self, user_id: str) -> Optional[Dict]:
         """Calculate consumption since last bill"""
@@ -595,25 +1285,16 @@ class Database:
         if not cycle:
             return None
         
-        # Get all readings
-        readings = self.get_readings(user_id)
-        if not readings:
+        # Highest reading since the billing cycle started, via the (user_id, date) index
+        with self._get_ro_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(SQL_CYCLE_LATEST_READING, (user_id, cycle["last_bill_date"], user_id))
+            latest_reading, has_readings = cursor.fetchone()
+        if not has_readings:
             return None
         
-        # Filter readings to only those AFTER the billing cycle start date
-        last_bill_date = cycle["last_bill_date"]
-        readings_after_cycle_start = [
-            r for r in readings 
-            if r["date"] >= last_bill_date
-        ]
-        
-        # Get the most recent reading value from filtered readings
-        if readings_after_cycle_start:
-            latest_reading = max(
-                [r["reading_kwh"] for r in readings_after_cycle_start],
-                default=cycle["last_bill_reading"]
-            )
-        else:
+        if latest_reading is None:
             # No readings after cycle start, use the bill reading itself
             latest_reading = cycle["last_bill_reading"]
         
@@ -633,52 +1314,44 @@ class Database:
         """Save or update user budget/goals"""
         with self._get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
-                INSERT OR REPLACE INTO user_budgets 
-                (user_id, monthly_kwh_goal, monthly_cost_goal, alert_threshold, updated_at)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-            """, (
+            cursor.execute(SQL_SAVE_BUDGET, (
                 user_id,
                 budget_data.get("monthly_kwh_goal"),
                 budget_data.get("monthly_cost_goal"),
                 budget_data.get("alert_threshold", 80.0)
             ))
             conn.commit()
-            return True
+        self._cache_invalidate("budget", user_id)
+        return True
 
     def get_budget(self, user_id: str) -> Optional[Dict]:
         """Get user budget with progress calculation"""
-        with self._get_connection() as conn:
+        goals, generation = self._cache_get("budget", user_id)
+        today = date.today()
+        month_range = _month_range(today.year, today.month)
+        with self._get_ro_connection() as conn:
             cursor = conn.cursor()
             
-            # Get budget settings
-            cursor.execute("""
-                SELECT monthly_kwh_goal, monthly_cost_goal, alert_threshold
-                FROM user_budgets WHERE user_id = ?
-            """, (user_id,))
+            # One round trip either way: goals and month usage together on a
+            # cache miss, only the month's usage when the goals are cached
+            if goals is _MISSING:
+                cursor.execute(SQL_GET_BUDGET, (*month_range, user_id))
+                row = cursor.fetchone()
+                goals = {
+                    "monthly_kwh_goal": row["monthly_kwh_goal"],
+                    "monthly_cost_goal": row["monthly_cost_goal"],
+                    "alert_threshold": row["alert_threshold"]
+                } if row else None
+                self._cache_put("budget", user_id, goals, generation)
+                current_kwh = row["current_kwh"] if row else None
+            elif goals:
+                cursor.row_factory = None
+                cursor.execute(SQL_MONTH_KWH, (user_id, *month_range))
+                (current_kwh,) = cursor.fetchone()
             
-            row = cursor.fetchone()
-            if not row:
+            if not goals:
                 return None
-            
-            budget = {
-                "monthly_kwh_goal": row["monthly_kwh_goal"],
-                "monthly_cost_goal": row["monthly_cost_goal"],
-                "alert_threshold": row["alert_threshold"]
-            }
-            
-            # Get current month usage for progress
-            today = date.today()
-            month_str = today.strftime("%Y-%m")
-            
-            cursor.execute("""
-                SELECT SUM(consumption_kwh) as current_kwh
-                FROM daily_usage 
-                WHERE user_id = ? AND date LIKE ?
-            """, (user_id, f"{month_str}%"))
-            
-            usage = cursor.fetchone()
-            current_kwh = usage["current_kwh"] or 0
+            budget = dict(goals)
             
             # Calculate progress percentages
             kwh_progress = 0
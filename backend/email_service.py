@@ -2,13 +2,16 @@
 Email Service for WattWise
 Sends weekly digests and alerts via SMTP
 """
+import queue
 import smtplib
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
+from string import Template
 import os
 
 # Configuration - Set these environment variables
@@ -19,109 +22,44 @@ SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
 FROM_EMAIL = os.getenv("FROM_EMAIL", "noreply@wattwise.app")
 FROM_NAME = os.getenv("FROM_NAME", "WattWise")
 
-class EmailService:
-    def __init__(self):
-        self.enabled = bool(SMTP_USER and SMTP_PASSWORD)
-        if not self.enabled:
-            print("⚠️ Email service disabled: SMTP credentials not configured")
-    
-    def _create_connection(self):
-        """Create SMTP connection"""
-        if not self.enabled:
-            return None
-        
-        try:
-            server = smtplib.SMTP(SMTP_HOST, SMTP_PORT)
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASSWORD)
-            return server
-        except Exception as e:
-            print(f"SMTP connection error: {e}")
-            return None
-    
-    def send_email(
-        self,
-        to_email: str,
-        subject: str,
-        html_body: str,
-        text_body: Optional[str] = None
-    ) -> bool:
-        """Send an email"""
-        if not self.enabled:
-            print(f"Email skipped (not configured): {subject} -> {to_email}")
-            return False
-        
-        try:
-            msg = MIMEMultipart("alternative")
-            msg["Subject"] = subject
-            msg["From"] = f"{FROM_NAME} <{FROM_EMAIL}>"
-            msg["To"] = to_email
-            
-            if text_body:
-                msg.attach(MIMEText(text_body, "plain"))
-            msg.attach(MIMEText(html_body, "html"))
-            
-            server = self._create_connection()
-            if server:
-                server.sendmail(FROM_EMAIL, to_email, msg.as_string())
-                server.quit()
-                return True
-            return False
-        except Exception as e:
-            print(f"Email send error: {e}")
-            return False
-    
-    def send_weekly_digest(
-        self,
-        to_email: str,
-        user_name: str,
-        weekly_data: dict
-    ) -> bool:
-        """Send weekly usage digest"""
-        subject = f"⚡ Your Weekly Energy Report - WattWise"
-        
-        total_kwh = weekly_data.get("total_kwh", 0)
-        total_cost = weekly_data.get("total_cost", 0)
-        avg_daily = weekly_data.get("avg_daily_kwh", 0)
-        anomalies = weekly_data.get("anomaly_count", 0)
-        trend = weekly_data.get("trend_percent", 0)
-        
-        trend_text = "📈 Up" if trend > 0 else "📉 Down" if trend < 0 else "➡️ Stable"
-        
-        html_body = f"""
+# The background sender keeps its SMTP session open this many seconds after the last email
+SMTP_IDLE_TIMEOUT = 30
+
+# Email bodies are compiled once at import; each send only substitutes values
+_DIGEST_HTML = Template("""
         <html>
         <body style="font-family: Arial, sans-serif; background-color: #f5f5f5; padding: 20px;">
             <div style="max-width: 600px; margin: 0 auto; background: white; border-radius: 10px; padding: 30px;">
                 <h1 style="color: #00f3ff; text-align: center;">⚡ WattWise Weekly Report</h1>
-                <p>Hi {user_name},</p>
+                <p>Hi $user_name,</p>
                 <p>Here's your energy consumption summary for the past week:</p>
                 
                 <div style="background: linear-gradient(135deg, #040b14, #0a1525); border-radius: 10px; padding: 20px; margin: 20px 0;">
                     <table style="width: 100%; color: white;">
                         <tr>
                             <td style="padding: 10px; text-align: center;">
-                                <div style="font-size: 32px; font-weight: bold; color: #00f3ff;">{total_kwh:.1f}</div>
+                                <div style="font-size: 32px; font-weight: bold; color: #00f3ff;">$total_kwh</div>
                                 <div style="color: #a0aab5;">kWh Total</div>
                             </td>
                             <td style="padding: 10px; text-align: center;">
-                                <div style="font-size: 32px; font-weight: bold; color: #00ff9d;">₹{total_cost:.0f}</div>
+                                <div style="font-size: 32px; font-weight: bold; color: #00ff9d;">₹$total_cost</div>
                                 <div style="color: #a0aab5;">Total Cost</div>
                             </td>
                         </tr>
                         <tr>
                             <td style="padding: 10px; text-align: center;">
-                                <div style="font-size: 24px; font-weight: bold;">{avg_daily:.1f}</div>
+                                <div style="font-size: 24px; font-weight: bold;">$avg_daily</div>
                                 <div style="color: #a0aab5;">Avg kWh/Day</div>
                             </td>
                             <td style="padding: 10px; text-align: center;">
-                                <div style="font-size: 24px; font-weight: bold;">{trend_text} {abs(trend):.1f}%</div>
+                                <div style="font-size: 24px; font-weight: bold;">$trend_text $trend_abs%</div>
                                 <div style="color: #a0aab5;">vs Last Week</div>
                             </td>
                         </tr>
                     </table>
                 </div>
                 
-                {"<p style='color: #ff3333;'>⚠️ " + str(anomalies) + " unusual usage day(s) detected this week.</p>" if anomalies > 0 else ""}
+                $anomaly_html
                 
                 <p style="color: #666;">Keep tracking your usage to save energy and money!</p>
                 
@@ -139,50 +77,37 @@ class EmailService:
             </div>
         </body>
         </html>
-        """
-        
-        text_body = f"""
+        """)
+
+_DIGEST_TEXT = Template("""
         WattWise Weekly Report
         
-        Hi {user_name},
+        Hi $user_name,
         
         Your energy summary for the past week:
-        - Total Usage: {total_kwh:.1f} kWh
-        - Total Cost: ₹{total_cost:.0f}
-        - Average: {avg_daily:.1f} kWh/day
-        - Trend: {trend_text} {abs(trend):.1f}%
+        - Total Usage: $total_kwh kWh
+        - Total Cost: ₹$total_cost
+        - Average: $avg_daily kWh/day
+        - Trend: $trend_text $trend_abs%
         
-        {"⚠️ " + str(anomalies) + " unusual usage days detected." if anomalies > 0 else ""}
+        $anomaly_text
         
         Keep tracking your usage to save energy!
         
         - WattWise Team
-        """
-        
-        return self.send_email(to_email, subject, html_body, text_body)
-    
-    def send_anomaly_alert(
-        self,
-        to_email: str,
-        user_name: str,
-        date: str,
-        consumption: float,
-        average: float
-    ) -> bool:
-        """Send anomaly alert email"""
-        subject = f"⚠️ Unusual Energy Usage Detected - WattWise"
-        
-        html_body = f"""
+        """)
+
+_ANOMALY_HTML = Template("""
         <html>
         <body style="font-family: Arial, sans-serif; padding: 20px;">
             <div style="max-width: 600px; margin: 0 auto; background: #fff3cd; border: 1px solid #ffc107; border-radius: 10px; padding: 20px;">
                 <h2 style="color: #856404;">⚠️ Unusual Usage Alert</h2>
-                <p>Hi {user_name},</p>
-                <p>We detected unusually high energy consumption on <strong>{date}</strong>:</p>
+                <p>Hi $user_name,</p>
+                <p>We detected unusually high energy consumption on <strong>$date</strong>:</p>
                 <ul>
-                    <li>Consumption: <strong>{consumption:.1f} kWh</strong></li>
-                    <li>Your average: <strong>{average:.1f} kWh</strong></li>
-                    <li>Difference: <strong>{((consumption - average) / average * 100):.0f}% higher</strong></li>
+                    <li>Consumption: <strong>$consumption kWh</strong></li>
+                    <li>Your average: <strong>$average kWh</strong></li>
+                    <li>Difference: <strong>$difference% higher</strong></li>
                 </ul>
                 <p>This could indicate:</p>
                 <ul>
@@ -194,7 +119,196 @@ class EmailService:
             </div>
         </body>
         </html>
-        """
+        """)
+
+class EmailService:
+    def __init__(self):
+        self.enabled = bool(SMTP_USER and SMTP_PASSWORD)
+        if not self.enabled:
+            print("⚠️ Email service disabled: SMTP credentials not configured")
+        # send_email only enqueues; a single worker thread does the SMTP work
+        self._queue = queue.Queue()
+        if self.enabled:
+            threading.Thread(target=self._worker, daemon=True).start()
+    
+    def _create_connection(self):
+        """Create SMTP connection"""
+        if not self.enabled:
+            return None
+        
+        try:
+            server = smtplib.SMTP(SMTP_HOST, SMTP_PORT)
+            server.starttls()
+            server.login(SMTP_USER, SMTP_PASSWORD)
+            return server
+        except Exception as e:
+            print(f"SMTP connection error: {e}")
+            return None
+    
+    def _close_connection(self, server):
+        try:
+            server.quit()
+        except Exception:
+            pass
+    
+    def _build_message(
+        self,
+        to_email: str,
+        subject: str,
+        html_body: str,
+        text_body: Optional[str] = None
+    ) -> str:
+        msg = MIMEMultipart("alternative")
+        msg["Subject"] = subject
+        msg["From"] = f"{FROM_NAME} <{FROM_EMAIL}>"
+        msg["To"] = to_email
+        
+        if text_body:
+            msg.attach(MIMEText(text_body, "plain"))
+        msg.attach(MIMEText(html_body, "html"))
+        return msg.as_string()
+    
+    def send_bulk(self, messages: List[Tuple[str, str, str, Optional[str]]]) -> List[bool]:
+        """Send (to_email, subject, html_body, text_body) messages over one SMTP session"""
+        if not self.enabled:
+            for to_email, subject, *_ in messages:
+                print(f"Email skipped (not configured): {subject} -> {to_email}")
+            return [False] * len(messages)
+        
+        server = self._create_connection()
+        if not server:
+            return [False] * len(messages)
+        
+        results = []
+        try:
+            for to_email, subject, html_body, text_body in messages:
+                # One bad recipient shouldn't stop the rest of the batch
+                try:
+                    server.sendmail(FROM_EMAIL, to_email,
+                                    self._build_message(to_email, subject, html_body, text_body))
+                    results.append(True)
+                except smtplib.SMTPServerDisconnected as e:
+                    print(f"Email send error: {e}")
+                    break
+                except Exception as e:
+                    print(f"Email send error: {e}")
+                    results.append(False)
+        finally:
+            self._close_connection(server)
+        return results + [False] * (len(messages) - len(results))
+    
+    def _worker(self):
+        """Deliver queued emails, reusing one SMTP session until it has been idle a while."""
+        server = None
+        while True:
+            try:
+                job = self._queue.get(timeout=SMTP_IDLE_TIMEOUT if server else None)
+            except queue.Empty:
+                self._close_connection(server)
+                server = None
+                continue
+            
+            to_email = job[0]
+            message = self._build_message(*job)
+            # Retry once on a fresh session in case the server dropped the idle one
+            for _ in range(2):
+                if server is None:
+                    server = self._create_connection()
+                    if server is None:
+                        break
+                try:
+                    server.sendmail(FROM_EMAIL, to_email, message)
+                    break
+                except smtplib.SMTPServerDisconnected:
+                    server = None
+                except Exception as e:
+                    print(f"Email send error: {e}")
+                    break
+            else:
+                print(f"Email send error: SMTP server disconnected ({to_email})")
+    
+    def send_email_sync(
+        self,
+        to_email: str,
+        subject: str,
+        html_body: str,
+        text_body: Optional[str] = None
+    ) -> bool:
+        """Send an email and wait for the SMTP result"""
+        return self.send_bulk([(to_email, subject, html_body, text_body)])[0]
+    
+    def send_email(
+        self,
+        to_email: str,
+        subject: str,
+        html_body: str,
+        text_body: Optional[str] = None
+    ) -> bool:
+        """Queue an email for background delivery; True when it was queued"""
+        if not self.enabled:
+            print(f"Email skipped (not configured): {subject} -> {to_email}")
+            return False
+        
+        self._queue.put((to_email, subject, html_body, text_body))
+        return True
+    
+    def send_weekly_digest(
+        self,
+        to_email: str,
+        user_name: str,
+        weekly_data: dict
+    ) -> bool:
+        """Send weekly usage digest"""
+        subject = f"⚡ Your Weekly Energy Report - WattWise"
+        
+        total_kwh = weekly_data.get("total_kwh", 0)
+        total_cost = weekly_data.get("total_cost", 0)
+        avg_daily = weekly_data.get("avg_daily_kwh", 0)
+        anomalies = weekly_data.get("anomaly_count", 0)
+        trend = weekly_data.get("trend_percent", 0)
+        
+        trend_text = "📈 Up" if trend > 0 else "📉 Down" if trend < 0 else "➡️ Stable"
+        
+        values = {
+            "user_name": user_name,
+            "total_kwh": f"{total_kwh:.1f}",
+            "total_cost": f"{total_cost:.0f}",
+            "avg_daily": f"{avg_daily:.1f}",
+            "trend_text": trend_text,
+            "trend_abs": f"{abs(trend):.1f}",
+        }
+        
+        html_body = _DIGEST_HTML.substitute(
+            values,
+            anomaly_html=(f"<p style='color: #ff3333;'>⚠️ {anomalies} unusual usage day(s) detected this week.</p>"
+                          if anomalies > 0 else "")
+        )
+        
+        text_body = _DIGEST_TEXT.substitute(
+            values,
+            anomaly_text=f"⚠️ {anomalies} unusual usage days detected." if anomalies > 0 else ""
+        )
+        
+        return self.send_email(to_email, subject, html_body, text_body)
+    
+    def send_anomaly_alert(
+        self,
+        to_email: str,
+        user_name: str,
+        date: str,
+        consumption: float,
+        average: float
+    ) -> bool:
+        """Send anomaly alert email"""
+        subject = f"⚠️ Unusual Energy Usage Detected - WattWise"
+        
+        html_body = _ANOMALY_HTML.substitute(
+            user_name=user_name,
+            date=date,
+            consumption=f"{consumption:.1f}",
+            average=f"{average:.1f}",
+            difference=f"{((consumption - average) / average * 100):.0f}"
+        )
         
         return self.send_email(to_email, subject, html_body)
 
@@ -1,14 +1,20 @@
-from fastapi import FastAPI, HTTPException, Body, Depends, Header, Query
+from fastapi import FastAPI, HTTPException, Body, Depends, Header, Query, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from typing import List, Optional
 from datetime import date, datetime
+import asyncio
+import re
 import uuid
 import io
 import csv
+import logging
+import logging.handlers
+import queue
+import orjson
 
 from models import Appliance, MeterReading, DailyUsage
-from database_sqlite import db
+from database_async import adb
 from ml_engine import ml_engine
 from auth import verify_token, DEMO_MODE
 from recommendations import recommendations_engine
@@ -16,19 +22,40 @@ from email_service import email_service
 from slab_rates import calculate_daily_cost, calculate_monthly_bill, get_slab_info, get_all_slabs
 from pydantic import BaseModel
 
-app = FastAPI(title="WattWise Backend", version="2.0.0")
+# Handlers only enqueue log records; a listener thread does the (blocking) writes
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+logger = logging.getLogger("wattwise")
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+logger.propagate = False
+
+class OrjsonResponse(JSONResponse):
+    """JSONResponse encoded with orjson, several times faster than json.dumps."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+def _static_json(content) -> bytes:
+    """Encode a response that never changes once, at import."""
+    return orjson.dumps(content)
+
+app = FastAPI(title="WattWise Backend", version="2.0.0", default_response_class=OrjsonResponse)
 
 # ==================== AUTH ====================
 
+# "Bearer <token>", case-insensitive scheme, any surrounding whitespace
+_AUTH_RE = re.compile(r"\s*bearer\s+(\S+)\s*", re.IGNORECASE)
+
 def get_current_user(authorization: Optional[str] = Header(None)):
     if not authorization:
         raise HTTPException(status_code=401, detail="Missing Authorization Header")
     
-    parts = authorization.split()
-    if len(parts) != 2 or parts[0].lower() != "bearer":
+    match = _AUTH_RE.fullmatch(authorization)
+    if match is None:
          raise HTTPException(status_code=401, detail="Invalid Authorization Header Format. Expected 'Bearer <token>'")
     
-    token = parts[1]
+    token = match.group(1)
     result = verify_token(token)
     if not result["valid"]:
         raise HTTPException(status_code=401, detail=f"Invalid token: {result.get('error')}")
@@ -56,72 +83,170 @@ app.add_middleware(
 @app.on_event("startup")
 def startup_event():
     # Database initializes on import
-    print("=" * 50)
-    print("🚀 WattWise Backend Starting...")
-    print(f"📡 Server will be available at: http://0.0.0.0:8000")
-    print(f"🔧 Demo Mode: {DEMO_MODE}")
-    print("=" * 50)
+    _log_listener.start()
+    logger.info("=" * 50)
+    logger.info("🚀 WattWise Backend Starting...")
+    logger.info("📡 Server will be available at: http://0.0.0.0:8000")
+    logger.info("🔧 Demo Mode: %s", DEMO_MODE)
+    logger.info("=" * 50)
+
+@app.on_event("shutdown")
+def shutdown_event():
+    # Checkpoints and closes every pooled SQLite connection
+    adb.close()
+    logger.info("🛑 WattWise Backend stopped")
+    # Flushes whatever is still queued
+    _log_listener.stop()
 
 # Request logging middleware
 @app.middleware("http")
 async def log_requests(request, call_next):
-    print(f"\n📥 {request.method} {request.url.path}")
-    print(f"   Client: {request.client.host if request.client else 'unknown'}")
+    logger.info("\n📥 %s %s", request.method, request.url.path)
+    logger.info("   Client: %s", request.client.host if request.client else "unknown")
     auth_header = request.headers.get("authorization", "None")
-    print(f"   Auth: {auth_header[:50]}..." if len(auth_header) > 50 else f"   Auth: {auth_header}")
+    logger.info("   Auth: %s", f"{auth_header[:50]}..." if len(auth_header) > 50 else auth_header)
     
     response = await call_next(request)
     
-    print(f"📤 Response: {response.status_code}")
+    logger.info("📤 Response: %s", response.status_code)
     return response
 
+# Nothing in the root response changes while the process runs
+ROOT_RESPONSE = {
+    "message": "WattWise Backend is running", 
+    "version": "2.0.0",
+    "demo_mode": DEMO_MODE,
+    "status": "✓ Server is healthy",
+    "endpoints": {
+        "appliances": "/appliances",
+        "readings": "/readings",
+        "daily_usage": "/daily-usage",
+        "dashboard": "/dashboard/summary"
+    }
+}
+
+ROOT_JSON = _static_json(ROOT_RESPONSE)
+
 @app.get("/")
 def read_root():
-    return {
-        "message": "WattWise Backend is running", 
-        "version": "2.0.0",
-        "demo_mode": DEMO_MODE,
-        "status": "✓ Server is healthy",
-        "endpoints": {
-            "appliances": "/appliances",
-            "readings": "/readings",
-            "daily_usage": "/daily-usage",
-            "dashboard": "/dashboard/summary"
-        }
-    }
+    return Response(content=ROOT_JSON, media_type="application/json")
+
+@app.get("/pool-health")
+async def pool_health(user: dict = Depends(get_current_user)):
+    """Connection pool occupancy and a database ping, for monitoring."""
+    return await adb.pool_status()
 
 # ==================== APPLIANCES ====================
 
 @app.get("/appliances", response_model=List[Appliance])
-def get_appliances(user: dict = Depends(get_current_user)):
-    return db.get_appliances(user["userid"])
+async def get_appliances(user: dict = Depends(get_current_user)):
+    return await adb.get_appliances(user["userid"])
 
 @app.post("/appliances", response_model=Appliance)
-def add_appliance(appliance: Appliance, user: dict = Depends(get_current_user)):
-    print(f"\n➕ Adding appliance for user {user['userid']}")
-    print(f"   Name: {appliance.name}, Power: {appliance.power_rating_watts}W, Hours: {appliance.usage_duration_hours_per_day}h/day")
+async def add_appliance(appliance: Appliance, user: dict = Depends(get_current_user)):
+    logger.info("\n➕ Adding appliance for user %s", user["userid"])
+    logger.info("   Name: %s, Power: %sW, Hours: %sh/day", appliance.name, appliance.power_rating_watts, appliance.usage_duration_hours_per_day)
     
     if not appliance.id:
-        appliance.id = str(uuid.uuid4())
-    db.add_appliance(appliance.dict(), user["userid"])
+        appliance.id = uuid.uuid4().hex
+    await adb.add_appliance(appliance.model_dump(), user["userid"])
     
-    print(f"   ✓ Appliance added with ID: {appliance.id}")
+    logger.info("   ✓ Appliance added with ID: %s", appliance.id)
     return appliance
 
 @app.delete("/appliances/{appliance_id}")
-def delete_appliance(appliance_id: str, user: dict = Depends(get_current_user)):
-    print(f"\n🗑️  Deleting appliance {appliance_id} for user {user['userid']}")
-    db.delete_appliance(appliance_id, user["userid"])
+async def delete_appliance(appliance_id: str, user: dict = Depends(get_current_user)):
+    logger.info("\n🗑️  Deleting appliance %s for user %s", appliance_id, user["userid"])
+    await adb.delete_appliance(appliance_id, user["userid"])
     return {"status": "deleted"}
 
 # ==================== READINGS ====================
 
+def _merge_daily_usage(all_daily: List[dict], usage: dict, limit: int = 100) -> List[dict]:
+    """all_daily (newest first) with usage saved into it, as get_daily_usage would now return it."""
+    day = str(usage["date"])
+    merged = [d for d in all_daily if d["date"] != day]
+    pos = next((i for i, d in enumerate(merged) if d["date"] < day), len(merged))
+    merged.insert(pos, {**usage, "date": day})
+    return merged[:limit]
+
 @app.get("/readings", response_model=List[MeterReading])
-def get_readings(user: dict = Depends(get_current_user)):
-    return db.get_readings(user["userid"])
+async def get_readings(user: dict = Depends(get_current_user)):
+    return await adb.get_readings(user["userid"])
+
+def _recalculate_day(db, user_id: str, date, day_readings: List[dict]):
+    """
+    Compute and save a day's usage once both its readings exist.
+    Runs inside the reading's write transaction on the sync database; returns
+    (daily usage, recent daily usage with it merged in, consumption), or None.
+    """
+    by_time = {r["time_of_day"]: r for r in day_readings}
+    
+    morning = by_time.get("morning")
+    night = by_time.get("night")
+    if not (morning and night):
+        return None
+    
+    m_val = float(morning["reading_kwh"])
+    n_val = float(night["reading_kwh"])
+    
+    if n_val < m_val:
+        consumption = 0
+    else:
+        consumption = n_val - m_val
+    
+    # Get estimated monthly usage for accurate slab calculation; the same
+    # fetch, with today's row merged in, feeds the retraining afterwards
+    all_daily = db.get_daily_usage(user_id)
+    recent_daily = all_daily[:30]
+    if recent_daily:
+        avg_daily = sum(d["consumption_kwh"] for d in recent_daily) / len(recent_daily)
+        estimated_monthly = avg_daily * 30
+    else:
+        estimated_monthly = consumption * 30
+    
+    # Calculate cost using Tamil Nadu slab rates
+    cost = calculate_daily_cost(consumption, estimated_monthly)
+    is_anomaly = ml_engine.is_anomaly(consumption)
+    
+    daily_usage = DailyUsage(
+        date=date,
+        consumption_kwh=round(consumption, 2),
+        cost=round(cost, 2),
+        is_anomaly=is_anomaly,
+        readings_count=2
+    )
+    
+    usage_row = daily_usage.model_dump()
+    db.save_daily_usage(usage_row, user_id)
+    
+    # Keep the fallback statistics current between retrains: swap out the
+    # day's previous value, if it had one, for the new one
+    previous = next((d for d in all_daily if d["date"] == str(date)), None)
+    if previous is not None:
+        ml_engine.remove(previous["consumption_kwh"])
+    ml_engine.update(daily_usage.consumption_kwh)
+    return daily_usage, _merge_daily_usage(all_daily, usage_row), consumption
+
+def _save_reading(db, user_id: str, reading: dict):
+    """Save a reading and recalculate its day, in one transaction."""
+    day_readings = db.add_reading(reading, user_id)
+    return _recalculate_day(db, user_id, reading["date"], day_readings)
+
+def _replace_reading(db, user_id: str, date: str, time_of_day: str, reading_kwh: float):
+    """Replace a reading and recalculate its day, in one transaction; None if it doesn't exist."""
+    updated = db.replace_reading(user_id, date, time_of_day, reading_kwh)
+    if updated is None:
+        return None
+    existing, day_readings = updated
+    return existing, _recalculate_day(db, user_id, date, day_readings)
 
 @app.post("/readings")
-def add_reading(reading: MeterReading, user: dict = Depends(get_current_user)):
+async def add_reading(
+    reading: MeterReading,
+    background_tasks: BackgroundTasks,
+    user: dict = Depends(get_current_user)
+):
     """
     Add a meter reading.
     Logic:
@@ -131,74 +256,35 @@ def add_reading(reading: MeterReading, user: dict = Depends(get_current_user)):
     """
     user_id = user["userid"]
     
-    print(f"\n💾 Adding reading for user {user_id}")
-    print(f"   Date: {reading.date}, Time: {reading.time_of_day}, Reading: {reading.reading_kwh} kWh")
+    logger.info("\n💾 Adding reading for user %s", user_id)
+    logger.info("   Date: %s, Time: %s, Reading: %s kWh", reading.date, reading.time_of_day, reading.reading_kwh)
     
-    # Get user's electricity rate
-    rate = db.get_electricity_rate(user_id)
+    # The reading and, once the day is complete, its daily usage commit together
+    recalculated = await adb.run_in_transaction(_save_reading, user_id, reading.model_dump())
     
-    db.add_reading(reading.dict(), user_id)
-    
-    # Check for daily completion
-    all_readings = db.get_readings(user_id)
-    today_readings = [r for r in all_readings if r["date"] == str(reading.date)]
-    
-    morning = next((r for r in today_readings if r["time_of_day"] == "morning"), None)
-    night = next((r for r in today_readings if r["time_of_day"] == "night"), None)
-    
-    if morning and night:
-        m_val = float(morning["reading_kwh"])
-        n_val = float(night["reading_kwh"])
-        
-        if n_val < m_val:
-             consumption = 0
-        else:
-            consumption = n_val - m_val
-        
-        print(f"   ✓ Both readings available! Consumption: {consumption} kWh")
+    if recalculated:
+        daily_usage, all_daily, consumption = recalculated
+        logger.info("   ✓ Both readings available! Consumption: %s kWh", consumption)
+        logger.info("   💰 Daily cost: ₹%.2f, Anomaly: %s", daily_usage.cost, daily_usage.is_anomaly)
         
-        # Get estimated monthly usage for accurate slab calculation
-        all_daily = db.get_daily_usage(user_id, limit=30)
-        if all_daily:
-            avg_daily = sum(d["consumption_kwh"] for d in all_daily) / len(all_daily)
-            estimated_monthly = avg_daily * 30
-        else:
-            estimated_monthly = consumption * 30
-        
-        # Calculate cost using Tamil Nadu slab rates
-        cost = calculate_daily_cost(consumption, estimated_monthly)
-        is_anomaly = ml_engine.is_anomaly(consumption)
-        
-        daily_usage = DailyUsage(
-            date=reading.date,
-            consumption_kwh=round(consumption, 2),
-            cost=round(cost, 2),
-            is_anomaly=is_anomaly,
-            readings_count=2
-        )
-        
-        db.save_daily_usage(daily_usage.dict(), user_id)
-        
-        print(f"   💰 Daily cost: ₹{cost:.2f}, Anomaly: {is_anomaly}")
-        
-        # Retrain ML model
-        all_daily = db.get_daily_usage(user_id)
-        if len(all_daily) > 5:
-             ml_engine.train(all_daily)
+        # Retrain ML model once the response is sent, every few completed days
+        if len(all_daily) > 5 and ml_engine.needs_retrain():
+            background_tasks.add_task(ml_engine.train, all_daily)
         
         return {"message": "Reading added. Daily usage calculated.", "daily_usage": daily_usage}
 
-    print(f"   ⏳ Waiting for {'night' if reading.time_of_day == 'morning' else 'morning'} reading")
+    logger.info("   ⏳ Waiting for %s reading", "night" if reading.time_of_day == "morning" else "morning")
     return {"message": "Reading added. Waiting for second reading to calculate daily usage."}
 
 class UpdateReadingRequest(BaseModel):
     reading_kwh: float
 
 @app.put("/readings/{date}/{time_of_day}")
-def update_reading(
+async def update_reading(
     date: str,
     time_of_day: str,
     request: UpdateReadingRequest,
+    background_tasks: BackgroundTasks,
     user: dict = Depends(get_current_user)
 ):
     """
@@ -215,67 +301,25 @@ def update_reading(
     if request.reading_kwh < 0:
         raise HTTPException(status_code=400, detail="Reading must be a positive number")
     
-    print(f"\n✏️  Updating reading for user {user_id}")
-    print(f"   Date: {date}, Time: {time_of_day}, New Reading: {request.reading_kwh} kWh")
+    logger.info("\n✏️  Updating reading for user %s", user_id)
+    logger.info("   Date: %s, Time: %s, New Reading: %s kWh", date, time_of_day, request.reading_kwh)
     
-    # Check if reading exists
-    existing = db.get_reading_by_date_time(user_id, date, time_of_day)
-    if not existing:
+    # Update the reading and recalculate the day in one transaction; its old value comes back too
+    updated = await adb.run_in_transaction(_replace_reading, user_id, date, time_of_day, request.reading_kwh)
+    if updated is None:
         raise HTTPException(status_code=404, detail=f"Reading not found for {date} {time_of_day}")
+    existing, recalculated = updated
     
-    # Update the reading
-    success = db.update_reading(user_id, date, time_of_day, request.reading_kwh)
-    if not success:
-        raise HTTPException(status_code=500, detail="Failed to update reading")
-    
-    print(f"   ✓ Reading updated from {existing['reading_kwh']} to {request.reading_kwh} kWh")
-    
-    # Recalculate daily usage
-    all_readings = db.get_readings(user_id)
-    day_readings = [r for r in all_readings if r["date"] == date]
-    
-    morning = next((r for r in day_readings if r["time_of_day"] == "morning"), None)
-    night = next((r for r in day_readings if r["time_of_day"] == "night"), None)
+    logger.info("   ✓ Reading updated from %s to %s kWh", existing["reading_kwh"], request.reading_kwh)
     
-    if morning and night:
-        m_val = float(morning["reading_kwh"])
-        n_val = float(night["reading_kwh"])
+    if recalculated:
+        daily_usage, all_daily, consumption = recalculated
+        logger.info("   🔄 Recalculating daily usage: %s kWh", consumption)
+        logger.info("   💰 Updated daily cost: ₹%.2f, Anomaly: %s", daily_usage.cost, daily_usage.is_anomaly)
         
-        if n_val < m_val:
-            consumption = 0
-        else:
-            consumption = n_val - m_val
-        
-        print(f"   🔄 Recalculating daily usage: {consumption} kWh")
-        
-        # Get estimated monthly usage for accurate slab calculation
-        all_daily = db.get_daily_usage(user_id, limit=30)
-        if all_daily:
-            avg_daily = sum(d["consumption_kwh"] for d in all_daily) / len(all_daily)
-            estimated_monthly = avg_daily * 30
-        else:
-            estimated_monthly = consumption * 30
-        
-        # Calculate cost using Tamil Nadu slab rates
-        cost = calculate_daily_cost(consumption, estimated_monthly)
-        is_anomaly = ml_engine.is_anomaly(consumption)
-        
-        daily_usage = DailyUsage(
-            date=date,
-            consumption_kwh=round(consumption, 2),
-            cost=round(cost, 2),
-            is_anomaly=is_anomaly,
-            readings_count=2
-        )
-        
-        db.save_daily_usage(daily_usage.dict(), user_id)
-        
-        print(f"   💰 Updated daily cost: ₹{cost:.2f}, Anomaly: {is_anomaly}")
-        
-        # Retrain ML model
-        all_daily = db.get_daily_usage(user_id)
-        if len(all_daily) > 5:
-            ml_engine.train(all_daily)
+        # Retrain ML model once the response is sent, every few completed days
+        if len(all_daily) > 5 and ml_engine.needs_retrain():
+            background_tasks.add_task(ml_engine.train, all_daily)
         
         return {
             "message": "Reading updated. Daily usage recalculated.",
@@ -297,46 +341,51 @@ def update_reading(
     }
 
 @app.get("/daily-usage", response_model=List[DailyUsage])
-def get_daily_usage(user: dict = Depends(get_current_user)):
-    return db.get_daily_usage(user["userid"])
+async def get_daily_usage(user: dict = Depends(get_current_user)):
+    return await adb.get_daily_usage(user["userid"])
 
 # ==================== REPORTS ====================
 
 @app.get("/reports/monthly")
-def get_monthly_report(
+async def get_monthly_report(
     month: str = Query(..., description="Month in YYYY-MM format"),
     user: dict = Depends(get_current_user)
 ):
     """Get monthly usage report with statistics."""
     try:
         year, mon = month.split("-")
-        return db.get_monthly_report(user["userid"], int(year), int(mon))
+        return await adb.get_monthly_report(user["userid"], int(year), int(mon))
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid month format. Use YYYY-MM")
 
 @app.get("/reports/comparison")
-def get_usage_comparison(user: dict = Depends(get_current_user)):
+async def get_usage_comparison(user: dict = Depends(get_current_user)):
     """Get this month vs last month comparison."""
-    from datetime import date
     user_id = user["userid"]
     today = date.today()
     
     # Current month
     current_year, current_month = today.year, today.month
-    current_report = db.get_monthly_report(user_id, current_year, current_month)
     
     # Last month
     if current_month == 1:
         last_year, last_month = current_year - 1, 12
     else:
         last_year, last_month = current_year, current_month - 1
-    last_report = db.get_monthly_report(user_id, last_year, last_month)
+    
+    # Both months' totals come straight from the monthly rollup, in one read
+    current_key = f"{current_year}-{current_month:02d}"
+    last_key = f"{last_year}-{last_month:02d}"
+    totals = await adb.get_monthly_totals(user_id, last_year, last_month, current_year, current_month)
+    no_data = {"total_kwh": 0, "total_cost": 0, "days_recorded": 0}
+    current_totals = totals.get(current_key, no_data)
+    last_totals = totals.get(last_key, no_data)
     
     # Calculate changes
-    current_kwh = current_report.get("stats", {}).get("total_kwh", 0) or 0
-    last_kwh = last_report.get("stats", {}).get("total_kwh", 0) or 0
-    current_cost = current_report.get("stats", {}).get("total_cost", 0) or 0
-    last_cost = last_report.get("stats", {}).get("total_cost", 0) or 0
+    current_kwh = current_totals["total_kwh"] or 0
+    last_kwh = last_totals["total_kwh"] or 0
+    current_cost = current_totals["total_cost"] or 0
+    last_cost = last_totals["total_cost"] or 0
     
     kwh_change = current_kwh - last_kwh
     kwh_change_percent = round((kwh_change / last_kwh * 100), 1) if last_kwh > 0 else 0
@@ -345,16 +394,16 @@ def get_usage_comparison(user: dict = Depends(get_current_user)):
     
     return {
         "current_month": {
-            "month": f"{current_year}-{current_month:02d}",
+            "month": current_key,
             "total_kwh": current_kwh,
             "total_cost": current_cost,
-            "days_recorded": current_report.get("stats", {}).get("days_recorded", 0)
+            "days_recorded": current_totals["days_recorded"]
         },
         "last_month": {
-            "month": f"{last_year}-{last_month:02d}",
+            "month": last_key,
             "total_kwh": last_kwh,
             "total_cost": last_cost,
-            "days_recorded": last_report.get("stats", {}).get("days_recorded", 0)
+            "days_recorded": last_totals["days_recorded"]
         },
         "comparison": {
             "kwh_change": round(kwh_change, 2),
@@ -366,43 +415,45 @@ def get_usage_comparison(user: dict = Depends(get_current_user)):
     }
 
 @app.get("/reports/yearly")
-def get_yearly_summary(
+async def get_yearly_summary(
     year: int = Query(..., description="Year in YYYY format"),
     user: dict = Depends(get_current_user)
 ):
     """Get yearly usage summary by month."""
-    return db.get_yearly_summary(user["userid"], year)
+    return await adb.get_yearly_summary(user["userid"], year)
 
 # ==================== PREDICTIONS ====================
 
 @app.get("/predictions/bill")
-def predict_bill(user: dict = Depends(get_current_user)):
+async def predict_bill(user: dict = Depends(get_current_user)):
     """Predict monthly electricity bill based on usage patterns with slab breakdown."""
     user_id = user["userid"]
     
+    # Recent usage and the current month's progress, fetched concurrently
+    today = date.today()
+    recent, current_month = await asyncio.gather(
+        adb.get_daily_usage_columns(user_id, limit=30),
+        adb.get_monthly_report(user_id, today.year, today.month)
+    )
+    
     # Get average daily usage
-    all_daily = db.get_daily_usage(user_id, limit=30)
-    if not all_daily:
+    recent_kwh = recent.consumption_kwh
+    if not recent_kwh:
         return {"message": "No usage data available for prediction"}
     
-    avg_daily = sum(d["consumption_kwh"] for d in all_daily) / len(all_daily)
+    avg_daily = sum(recent_kwh) / len(recent_kwh)
     estimated_monthly = avg_daily * 30
     
     # Calculate using slab rates
     bill = calculate_monthly_bill(estimated_monthly)
     
-    # Get current month progress
-    from datetime import date
-    today = date.today()
-    current_month = db.get_monthly_report(user_id, today.year, today.month)
-    
     return {
         "predicted_monthly_kwh": round(estimated_monthly, 2),
         "predicted_monthly_cost": bill["total_amount"],
         "avg_daily_kwh": round(avg_daily, 2),
         "slab_breakdown": bill["breakdown"],
         "current_month": {
-            "month": today.strftime("%Y-%m"),
+            "month": today.isoformat()[:7],
             "kwh_so_far": current_month["stats"]["total_kwh"],
             "cost_so_far": current_month["stats"]["total_cost"],
             "days_recorded": current_month["stats"]["days_recorded"]
@@ -412,14 +463,18 @@ def predict_bill(user: dict = Depends(get_current_user)):
 
 # ==================== BILLING INFO ====================
 
+# The slab table is fixed, so the response is built once
+SLABS_RESPONSE = {
+    "state": "Tamil Nadu",
+    "slabs": get_all_slabs(),
+    "note": "First 100 units are FREE for domestic consumers"
+}
+SLABS_JSON = _static_json(SLABS_RESPONSE)
+
 @app.get("/billing/slabs")
 def get_slab_rates():
     """Get Tamil Nadu electricity slab rates."""
-    return {
-        "state": "Tamil Nadu",
-        "slabs": get_all_slabs(),
-        "note": "First 100 units are FREE for domestic consumers"
-    }
+    return Response(content=SLABS_JSON, media_type="application/json")
 
 @app.get("/billing/calculate")
 def calculate_bill(
@@ -431,20 +486,27 @@ def calculate_bill(
 # ==================== ANALYTICS ====================
 
 @app.get("/analytics/patterns")
-def get_usage_patterns(user: dict = Depends(get_current_user)):
+async def get_usage_patterns(user: dict = Depends(get_current_user)):
     """Get usage patterns analysis (weekday vs weekend)."""
-    return db.get_usage_patterns(user["userid"])
+    return await adb.get_usage_patterns(user["userid"])
 
 # ==================== TIPS ====================
 
+# Tips only change when the user's data or the day does, so clients may reuse them briefly
+TIPS_CACHE_CONTROL = "private, max-age=300"
+
 @app.get("/tips")
-def get_energy_tips(user: dict = Depends(get_current_user)):
+async def get_energy_tips(response: Response, user: dict = Depends(get_current_user)):
     """Get personalized energy-saving recommendations."""
     user_id = user["userid"]
-    appliances = db.get_appliances(user_id)
-    daily_usage = db.get_daily_usage(user_id, limit=30)
+    appliances, daily_usage = await asyncio.gather(
+        adb.get_appliances(user_id),
+        adb.get_daily_usage(user_id, limit=30)
+    )
     
-    return recommendations_engine.get_tips_for_usage(daily_usage, appliances)
+    # General tips rotate daily rather than at random
+    response.headers["Cache-Control"] = TIPS_CACHE_CONTROL
+    return recommendations_engine.get_tips_for_usage(daily_usage, appliances, date.today().toordinal())
 
 # ==================== SETTINGS ====================
 
@@ -455,105 +517,133 @@ class UserSettings(BaseModel):
     theme: str = "dark"
 
 @app.get("/settings")
-def get_settings(user: dict = Depends(get_current_user)):
+async def get_settings(user: dict = Depends(get_current_user)):
     """Get user settings."""
-    return db.get_user_settings(user["userid"])
+    return await adb.get_user_settings(user["userid"])
 
 @app.put("/settings")
-def update_settings(settings: UserSettings, user: dict = Depends(get_current_user)):
+async def update_settings(settings: UserSettings, user: dict = Depends(get_current_user)):
     """Update user settings."""
-    db.update_user_settings(user["userid"], settings.dict())
+    await adb.update_user_settings(user["userid"], settings.model_dump())
     return {"message": "Settings updated", "settings": settings}
 
 # ==================== EXPORT ====================
 
+def _iter_csv(header: list, rows):
+    """Yield a CSV one line at a time, reusing a single small line buffer."""
+    line = io.StringIO()
+    writer = csv.writer(line)
+
+    def format_row(row):
+        line.seek(0)
+        line.truncate()
+        writer.writerow(row)
+        return line.getvalue()
+
+    yield format_row(header)
+    for row in rows:
+        yield format_row(row)
+
+# Usage rows are ISO dates, numbers and Yes/No, none of which ever needs CSV
+# quoting, so lines are formatted directly (with csv.writer's \r\n ending)
+_USAGE_CSV_LINE = "{},{},{},{},{}\r\n".format
+
+# Rows fetched per database call while an export streams
+EXPORT_PAGE_SIZE = 200
+
+async def _iter_usage_csv(user_id: str, limit: int):
+    """Yield the usage export one page of lines per chunk.
+
+    Only one page is held in memory, and no pooled connection stays checked
+    out while the client reads; each page goes out as a single body chunk.
+    """
+    yield _USAGE_CSV_LINE("Date", "Consumption (kWh)", "Cost (₹)", "Anomaly", "Readings Count")
+    before = None
+    while limit > 0:
+        page = await adb.get_daily_usage_page(user_id, before, min(EXPORT_PAGE_SIZE, limit))
+        if page:
+            yield "".join([
+                _USAGE_CSV_LINE(
+                    day,
+                    consumption_kwh,
+                    cost,
+                    "Yes" if is_anomaly else "No",
+                    "" if readings_count is None else readings_count
+                )
+                for day, consumption_kwh, cost, is_anomaly, readings_count in page
+            ])
+        if len(page) < EXPORT_PAGE_SIZE:
+            break
+        limit -= len(page)
+        before = page[-1][0]
+
 @app.get("/export/csv")
-def export_data_csv(user: dict = Depends(get_current_user)):
+async def export_data_csv(user: dict = Depends(get_current_user)):
     """Export all usage data as CSV."""
     user_id = user["userid"]
-    daily_usage = db.get_daily_usage(user_id, limit=1000)
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header
-    writer.writerow(["Date", "Consumption (kWh)", "Cost (₹)", "Anomaly", "Readings Count"])
-    
-    # Data rows
-    for usage in daily_usage:
-        writer.writerow([
-            usage["date"],
-            usage["consumption_kwh"],
-            usage["cost"],
-            "Yes" if usage["is_anomaly"] else "No",
-            usage["readings_count"]
-        ])
-    
-    output.seek(0)
     
     return StreamingResponse(
-        iter([output.getvalue()]),
+        _iter_usage_csv(user_id, limit=1000),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename=wattwise_usage_{user_id[:8]}.csv"}
     )
 
 @app.get("/export/appliances-csv")
-def export_appliances_csv(user: dict = Depends(get_current_user)):
+async def export_appliances_csv(user: dict = Depends(get_current_user)):
     """Export appliances data as CSV."""
     user_id = user["userid"]
-    appliances = db.get_appliances(user_id)
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
+    appliances = await adb.get_appliances(user_id)
     
-    writer.writerow(["Name", "Power Rating (W)", "Daily Usage (Hours)", "Est. Daily kWh"])
-    
-    for app in appliances:
-        daily_kwh = (app["power_rating_watts"] * app["usage_duration_hours_per_day"]) / 1000
-        writer.writerow([
+    rows = (
+        (
             app["name"],
             app["power_rating_watts"],
             app["usage_duration_hours_per_day"],
-            round(daily_kwh, 2)
-        ])
-    
-    output.seek(0)
+            round((app["power_rating_watts"] * app["usage_duration_hours_per_day"]) / 1000, 2)
+        )
+        for app in appliances
+    )
     
     return StreamingResponse(
-        iter([output.getvalue()]),
+        _iter_csv(["Name", "Power Rating (W)", "Daily Usage (Hours)", "Est. Daily kWh"], rows),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename=wattwise_appliances_{user_id[:8]}.csv"}
     )
 
 # ==================== DASHBOARD SUMMARY ====================
 
+def _usage_totals(days: List[dict]):
+    """Total kWh, total cost and anomaly count of daily usage rows, in one pass."""
+    total_kwh = total_cost = anomaly_count = 0
+    for d in days:
+        total_kwh += d["consumption_kwh"]
+        total_cost += d["cost"]
+        anomaly_count += d["is_anomaly"]
+    return total_kwh, total_cost, anomaly_count
+
 @app.get("/dashboard/summary")
-def get_dashboard_summary(user: dict = Depends(get_current_user)):
+async def get_dashboard_summary(user: dict = Depends(get_current_user)):
     """Get comprehensive dashboard summary in one call."""
     user_id = user["userid"]
     
-    # Get today's data
+    # Recent usage and the bill prediction come back from one query
     today = date.today().isoformat()
-    daily_usage = db.get_daily_usage(user_id, limit=30)
+    bundle = await adb.get_dashboard_bundle(user_id)
+    daily_usage = bundle["daily_usage"]
     today_usage = next((d for d in daily_usage if d["date"] == today), None)
     
     # Calculate stats
     last_7_days = daily_usage[:7]
-    week_avg = sum(d["consumption_kwh"] for d in last_7_days) / len(last_7_days) if last_7_days else 0
-    week_total = sum(d["consumption_kwh"] for d in last_7_days)
-    week_cost = sum(d["cost"] for d in last_7_days)
+    week_total, week_cost, _ = _usage_totals(last_7_days)
+    week_avg = week_total / len(last_7_days) if last_7_days else 0
     
     # Trend calculation
     if len(daily_usage) >= 14:
-        this_week = sum(d["consumption_kwh"] for d in daily_usage[:7])
-        last_week = sum(d["consumption_kwh"] for d in daily_usage[7:14])
-        trend = round(((this_week - last_week) / last_week * 100) if last_week > 0 else 0, 1)
+        last_week, _, _ = _usage_totals(daily_usage[7:14])
+        trend = round(((week_total - last_week) / last_week * 100) if last_week > 0 else 0, 1)
     else:
         trend = 0
     
-    # Predictions
-    prediction = db.predict_monthly_bill(user_id)
-    
     return {
         "today": {
             "consumption_kwh": today_usage["consumption_kwh"] if today_usage else 0,
@@ -566,7 +656,7 @@ def get_dashboard_summary(user: dict = Depends(get_current_user)):
             "avg_daily_kwh": round(week_avg, 2),
             "trend_percent": trend
         },
-        "prediction": prediction,
+        "prediction": bundle["prediction"],
         "recent_usage": daily_usage[:7]
     }
 
@@ -577,35 +667,31 @@ class EmailRequest(BaseModel):
     user_name: str
 
 @app.post("/email/weekly-digest")
-def send_weekly_digest(request: EmailRequest, user: dict = Depends(get_current_user)):
+async def send_weekly_digest(request: EmailRequest, user: dict = Depends(get_current_user)):
     """Send weekly digest email to user"""
     user_id = user["userid"]
     
-    # Get last 7 days of data
-    daily_usage = db.get_daily_usage(user_id, limit=14)
-    last_7 = daily_usage[:7]
-    prev_7 = daily_usage[7:14]
+    # Sums for the last 14 days, computed in SQLite
+    stats = await adb.get_weekly_digest_stats(user_id)
     
-    if not last_7:
+    if not stats["days"]:
         raise HTTPException(status_code=400, detail="No usage data available")
     
-    total_kwh = sum(d["consumption_kwh"] for d in last_7)
-    total_cost = sum(d["cost"] for d in last_7)
-    avg_daily = total_kwh / len(last_7) if last_7 else 0
-    anomaly_count = sum(1 for d in last_7 if d["is_anomaly"])
+    total_kwh = stats["total_kwh"]
+    avg_daily = total_kwh / stats["days"]
     
     # Calculate trend
-    if prev_7:
-        prev_total = sum(d["consumption_kwh"] for d in prev_7)
+    if stats["prev_days"]:
+        prev_total = stats["prev_kwh"]
         trend = ((total_kwh - prev_total) / prev_total * 100) if prev_total > 0 else 0
     else:
         trend = 0
     
     weekly_data = {
         "total_kwh": total_kwh,
-        "total_cost": total_cost,
+        "total_cost": stats["total_cost"],
         "avg_daily_kwh": avg_daily,
-        "anomaly_count": anomaly_count,
+        "anomaly_count": stats["anomaly_count"],
         "trend_percent": trend
     }
     
@@ -620,7 +706,8 @@ def send_weekly_digest(request: EmailRequest, user: dict = Depends(get_current_u
 @app.post("/email/test")
 def test_email(request: EmailRequest):
     """Send a test email"""
-    success = email_service.send_email(
+    # Sent inline so the response reports whether SMTP actually accepted it
+    success = email_service.send_email_sync(
         request.email,
         "WattWise Test Email",
         "<h1>Test Email</h1><p>Your email configuration is working!</p>",
@@ -637,13 +724,13 @@ class BillingCycleRequest(BaseModel):
     billing_period_months: int = 2
 
 @app.post("/billing-cycle")
-def save_billing_cycle(request: BillingCycleRequest, user: dict = Depends(get_current_user)):
+async def save_billing_cycle(request: BillingCycleRequest, user: dict = Depends(get_current_user)):
     """Save billing cycle information from last TNEB bill"""
     user_id = user["userid"]
     
-    print(f"\n💰 Saving billing cycle for user {user_id}")
-    print(f"   Last bill date: {request.last_bill_date}")
-    print(f"   Last bill reading: {request.last_bill_reading} kWh")
+    logger.info("\n💰 Saving billing cycle for user %s", user_id)
+    logger.info("   Last bill date: %s", request.last_bill_date)
+    logger.info("   Last bill reading: %s kWh", request.last_bill_reading)
     
     cycle_data = {
         "last_bill_date": request.last_bill_date,
@@ -652,16 +739,16 @@ def save_billing_cycle(request: BillingCycleRequest, user: dict = Depends(get_cu
         "billing_period_months": request.billing_period_months
     }
     
-    db.save_billing_cycle(user_id, cycle_data)
+    await adb.save_billing_cycle(user_id, cycle_data)
     
     return {"message": "Billing cycle saved successfully", "data": cycle_data}
 
 @app.get("/billing-cycle")
-def get_billing_cycle_status(user: dict = Depends(get_current_user)):
+async def get_billing_cycle_status(user: dict = Depends(get_current_user)):
     """Get current billing cycle status"""
     user_id = user["userid"]
     
-    cycle_info = db.get_current_cycle_consumption(user_id)
+    cycle_info = await adb.get_current_cycle_consumption(user_id)
     
     if not cycle_info:
         return {"has_cycle": False, "message": "No billing cycle configured"}
@@ -692,11 +779,11 @@ def get_billing_cycle_status(user: dict = Depends(get_current_user)):
             "days_remaining": max(0, 60 - days_in_cycle),
             "cycle_ending_soon": days_in_cycle >= 55,  # Alert when 5 days or less remaining
             "cycle_ended": days_in_cycle >= 60,  # Cycle has ended, prompt to update
-            "estimated_cycle_end": estimated_end.strftime("%Y-%m-%d"),
+            "estimated_cycle_end": estimated_end.date().isoformat(),
             "billing_period_months": cycle_info["billing_period_months"]
         }
     except Exception as e:
-        print(f"Error calculating cycle status: {e}")
+        logger.error("Error calculating cycle status: %s", e)
         return {
             "has_cycle": True,
             **cycle_info,
@@ -712,17 +799,17 @@ class BudgetSettings(BaseModel):
     alert_threshold: float = 80.0
 
 @app.post("/budget")
-def save_budget(budget: BudgetSettings, user: dict = Depends(get_current_user)):
+async def save_budget(budget: BudgetSettings, user: dict = Depends(get_current_user)):
     """Save user budget/goals"""
     user_id = user["userid"]
-    db.save_budget(user_id, budget.dict())
+    await adb.save_budget(user_id, budget.model_dump())
     return {"message": "Budget saved successfully"}
 
 @app.get("/budget")
-def get_budget(user: dict = Depends(get_current_user)):
+async def get_budget(user: dict = Depends(get_current_user)):
     """Get user budget with progress"""
     user_id = user["userid"]
-    budget = db.get_budget(user_id)
+    budget = await adb.get_budget(user_id)
     
     if not budget:
         return {"has_budget": False, "message": "No budget set"}
@@ -3,56 +3,160 @@ Enhanced Anomaly Detection Engine for WattWise
 Uses Isolation Forest with improved tuning and fallback heuristics.
 """
 import numpy as np
+import hashlib
+from bisect import bisect_left
+from sklearn.base import clone
 from sklearn.ensemble import IsolationForest
-import pandas as pd
-from typing import List, Dict, Optional
+import threading
+from typing import List, Dict, NamedTuple, Optional
 from datetime import datetime, timedelta
 
+# Once fitted, the model is refit after this many new or changed days
+RETRAIN_EVERY = 5
+
+class _AnomalyLookup(NamedTuple):
+    """The fitted model's output per interval between consecutive split thresholds."""
+    thresholds: List[float]      # as a list, for the scalar bisect
+    labels: List[bool]
+    scores: List[float]
+    threshold_array: np.ndarray  # as arrays, for batch searchsorted
+    label_array: np.ndarray
+
 class AnomalyDetector:
     def __init__(self):
         self.model = IsolationForest(
             contamination=0.1,  # 10% anomaly rate - more balanced
             random_state=42,
             n_estimators=100,
-            max_samples='auto'
+            max_samples='auto',
+            max_features=1.0  # all features, so fit skips the per-tree column subset copy
         )
         self.is_fitted = False
         self.historical_mean = 0
         self.historical_std = 0
+        self._n = 0  # Welford accumulator behind historical_mean/std
+        self._m2 = 0.0
         self.min_data_points = 5
+        self._anomaly_lookup: Optional[_AnomalyLookup] = None
+        self._fit_fingerprint: Optional[bytes] = None  # digest of the data the model was fit on
+        self._dirty_count = 0
+        self._train_lock = threading.Lock()
+        self._stats_lock = threading.Lock()  # guards the accumulator against overlapping updates
+    
+    def needs_retrain(self) -> bool:
+        """Count one new or changed day; True when a retrain is due."""
+        self._dirty_count += 1
+        if self.is_fitted and self._dirty_count < RETRAIN_EVERY:
+            return False
+        self._dirty_count = 0
+        return True
     
     def train(self, historical_data: List[Dict]) -> bool:
         """
         Train the model on historical daily usage data.
         Returns True if training was successful.
         """
+        # Background retrains may overlap; fit one at a time
+        with self._train_lock:
+            return self._train(historical_data)
+    
+    def _train(self, historical_data: List[Dict]) -> bool:
         if len(historical_data) < self.min_data_points:
             return False
         
-        df = pd.DataFrame(historical_data)
-        if 'consumption_kwh' not in df.columns:
+        if not any('consumption_kwh' in d for d in historical_data):
             return False
         
-        # Filter out invalid data
-        df = df[df['consumption_kwh'] > 0]
+        # Filter out invalid data (missing values become NaN and drop out too)
+        x = np.array([d.get('consumption_kwh') for d in historical_data], dtype=np.float64)
+        x = x[x > 0]
         
-        if len(df) < self.min_data_points:
+        if len(x) < self.min_data_points:
             return False
         
-        X = df[['consumption_kwh']].values
-        
-        # Store statistics for fallback detection
-        self.historical_mean = float(np.mean(X))
-        self.historical_std = float(np.std(X))
+        # Store statistics for fallback detection, and seed the online accumulator from them
+        with self._stats_lock:
+            self.historical_mean = float(np.mean(x))
+            self.historical_std = float(np.std(x))
+            self._n, self._m2 = len(x), self.historical_std ** 2 * len(x)
         
         # Only train if we have enough variance
         if self.historical_std > 0.1:
-            self.model.fit(X)
+            # Same data as the current fit (e.g. a reading re-saved unchanged): keep the model
+            fingerprint = hashlib.blake2b(x.tobytes(), digest_size=16).digest()
+            if self.is_fitted and fingerprint == self._fit_fingerprint:
+                return True
+            
+            # Trees split on float32; passing it contiguous spares fit a conversion copy
+            X = np.ascontiguousarray(x, dtype=np.float32).reshape(-1, 1)
+            # Fit a copy and swap it in, so concurrent is_anomaly calls never see a half-fit model
+            model = clone(self.model).fit(X)
+            self.model, self._anomaly_lookup = model, self._build_lookup(model)
+            self._fit_fingerprint = fingerprint
             self.is_fitted = True
             return True
         
         return False
     
+    @staticmethod
+    def _build_lookup(model: IsolationForest) -> _AnomalyLookup:
+        """
+        Precompute the model's score and verdict for every input range.
+        
+        With one feature, every tree routes x by `x <= threshold` comparisons
+        (on float32 x), so decision_function() (and so predict()) is constant
+        between consecutive split thresholds; one call per interval covers all inputs.
+        """
+        thresholds = np.unique(np.concatenate([
+            est.tree_.threshold[est.tree_.feature >= 0] for est in model.estimators_
+        ]))
+        
+        # A float32 point at or below each threshold, plus one above the last
+        reps = thresholds.astype(np.float32)
+        too_high = reps.astype(np.float64) > thresholds
+        reps[too_high] = np.nextafter(reps[too_high], np.float32(-np.inf))
+        last = np.float32(thresholds[-1]) if len(thresholds) else np.float32(0)
+        if len(thresholds) and last <= thresholds[-1]:
+            last = np.nextafter(last, np.float32(np.inf))
+        reps = np.append(reps, last)
+        
+        # predict() labels a point -1 (outlier) exactly when its score is negative
+        scores = model.decision_function(reps.reshape(-1, 1))
+        labels = scores < 0
+        return _AnomalyLookup(thresholds.tolist(), labels.tolist(), scores.tolist(), thresholds, labels)
+    
+    def update(self, consumption: float):
+        """
+        Fold one new day into the fallback statistics in O(1) (Welford's method).
+        The fitted model itself only changes on the next train().
+        """
+        with self._stats_lock:
+            # Until train() has seeded the accumulator, the fixed thresholds stay the fallback
+            if consumption <= 0 or self._n == 0:
+                return
+            
+            self._n += 1
+            delta = consumption - self.historical_mean
+            self.historical_mean += delta / self._n
+            self._m2 += delta * (consumption - self.historical_mean)
+            self.historical_std = (self._m2 / self._n) ** 0.5
+    
+    def remove(self, consumption: float):
+        """
+        Take one day back out of the fallback statistics in O(1): update() run in reverse.
+        Used when a day is recalculated, before its new value is folded in.
+        """
+        with self._stats_lock:
+            if consumption <= 0 or self._n < 2:
+                return
+            
+            delta = consumption - self.historical_mean
+            self._n -= 1
+            self.historical_mean -= delta / self._n
+            # Rounding can leave a tiny negative sum of squares; clamp it
+            self._m2 = max(self._m2 - delta * (consumption - self.historical_mean), 0.0)
+            self.historical_std = (self._m2 / self._n) ** 0.5
+    
     def is_anomaly(self, current_consumption: float) -> bool:
         """
         Check if the current consumption is an anomaly.
@@ -62,9 +166,9 @@ class AnomalyDetector:
             return False
         
         if self.is_fitted:
-            prediction = self.model.predict([[current_consumption]])
-            # -1 for outliers, 1 for inliers
-            return prediction[0] == -1
+            # Same answer as model.predict (-1 for outliers), via the precomputed intervals
+            lookup = self._anomaly_lookup
+            return lookup.labels[bisect_left(lookup.thresholds, float(np.float32(current_consumption)))]
         
         # Fallback: Statistical method (Z-score based)
         if self.historical_std > 0:
@@ -74,6 +178,22 @@ class AnomalyDetector:
         # Ultimate fallback: Fixed thresholds
         return current_consumption > 50.0 or current_consumption < 0.5
     
+    def is_anomaly_batch(self, consumptions) -> np.ndarray:
+        """
+        Vectorized is_anomaly: one boolean per consumption value.
+        """
+        x = np.asarray(consumptions, dtype=np.float64).ravel()
+        
+        if self.is_fitted:
+            lookup = self._anomaly_lookup
+            flags = lookup.label_array[np.searchsorted(lookup.threshold_array, x.astype(np.float32).astype(np.float64))]
+        elif self.historical_std > 0:
+            flags = np.abs(x - self.historical_mean) / self.historical_std > 2.5
+        else:
+            flags = (x > 50.0) | (x < 0.5)
+        
+        return flags & (x > 0)
+    
     def get_anomaly_score(self, current_consumption: float) -> float:
         """
         Get anomaly score (lower = more anomalous).
@@ -82,8 +202,9 @@ class AnomalyDetector:
         if not self.is_fitted:
             return 0.0
         
-        score = self.model.decision_function([[current_consumption]])
-        return float(score[0])
+        # Same value as model.decision_function, read from the precomputed intervals
+        lookup = self._anomaly_lookup
+        return lookup.scores[bisect_left(lookup.thresholds, float(np.float32(current_consumption)))]
     
     def analyze_trend(self, daily_data: List[Dict], days: int = 7) -> Dict:
         """
@@ -97,14 +218,13 @@ class AnomalyDetector:
         if len(recent) < 2:
             return {"trend": "insufficient_data", "change_percent": 0}
         
-        # Sort by date
-        sorted_data = sorted(recent, key=lambda x: x.get("date", ""))
+        # Sort by date, as day numbers rather than strings
+        dates = np.array([d["date"] for d in recent], dtype="datetime64[D]")
+        kwh = np.array([d["consumption_kwh"] for d in recent], dtype=np.float64)
+        sorted_kwh = kwh[np.argsort(dates, kind="stable")]
         
-        first_half = sorted_data[:len(sorted_data)//2]
-        second_half = sorted_data[len(sorted_data)//2:]
-        
-        avg_first = np.mean([d["consumption_kwh"] for d in first_half])
-        avg_second = np.mean([d["consumption_kwh"] for d in second_half])
+        avg_first = sorted_kwh[:len(sorted_kwh)//2].mean()
+        avg_second = sorted_kwh[len(sorted_kwh)//2:].mean()
         
         if avg_first > 0:
             change = ((avg_second - avg_first) / avg_first) * 100
@@ -132,30 +252,30 @@ class AnomalyDetector:
         if len(daily_data) < 7:
             return {"patterns_detected": False, "reason": "insufficient_data"}
         
-        df = pd.DataFrame(daily_data)
-        df['date'] = pd.to_datetime(df['date'])
-        df['day_of_week'] = df['date'].dt.dayofweek  # 0=Monday, 6=Sunday
+        dates = np.array([d["date"] for d in daily_data], dtype="datetime64[D]")
+        kwh = np.fromiter((d["consumption_kwh"] for d in daily_data), dtype=np.float64, count=len(daily_data))
+        # Day 0 of the epoch (1970-01-01) was a Thursday: 0=Monday, 6=Sunday
+        day_of_week = (dates.astype(np.int64) + 3) % 7
         
         # Weekend vs Weekday
-        weekday = df[df['day_of_week'] < 5]['consumption_kwh'].mean()
-        weekend = df[df['day_of_week'] >= 5]['consumption_kwh'].mean()
+        is_weekday = day_of_week < 5
+        weekday = kwh[is_weekday].mean() if is_weekday.any() else 0
+        weekend = kwh[~is_weekday].mean() if not is_weekday.all() else 0
+        
+        # Find peak and low days among the weekdays that have data, from
+        # per-weekday sums and counts taken in one pass each
+        sums = np.bincount(day_of_week, weights=kwh, minlength=7)
+        counts = np.bincount(day_of_week, minlength=7)
+        day_avg = sums / np.maximum(counts, 1)
+        day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
         
-        patterns = {
+        return {
             "patterns_detected": True,
-            "weekday_avg": round(weekday, 2) if not np.isnan(weekday) else 0,
-            "weekend_avg": round(weekend, 2) if not np.isnan(weekend) else 0,
-            "peak_day": None,
-            "low_day": None
+            "weekday_avg": round(weekday, 2),
+            "weekend_avg": round(weekend, 2),
+            "peak_day": day_names[np.where(counts > 0, day_avg, -np.inf).argmax()],
+            "low_day": day_names[np.where(counts > 0, day_avg, np.inf).argmin()]
         }
-        
-        # Find peak and low days
-        day_avg = df.groupby('day_of_week')['consumption_kwh'].mean()
-        if len(day_avg) > 0:
-            day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-            patterns["peak_day"] = day_names[day_avg.idxmax()]
-            patterns["low_day"] = day_names[day_avg.idxmin()]
-        
-        return patterns
 
 
 # Global instance
@@ -2,7 +2,9 @@
 Energy-Saving Recommendations Engine for WattWise
 Generates personalized tips based on appliance usage patterns.
 """
-from typing import List, Dict
+import random
+from functools import lru_cache
+from typing import List, Dict, Optional
 
 class RecommendationsEngine:
     """Rule-based energy saving recommendations."""
@@ -94,6 +96,21 @@ class RecommendationsEngine:
         }
     ]
     
+    def __init__(self):
+        # General tips are shuffled once with a fixed seed, so every process gets the
+        # same order; requests then just rotate through them
+        self._general_order = random.Random(0).sample(self.GENERAL_TIPS, len(self.GENERAL_TIPS))
+    
+    # Appliance names repeat across requests and users, so the rule scan is memoized
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _rule_for(name: str) -> Optional[Dict]:
+        """Rules of the first EFFICIENCY_RULES key found in a lowercased name."""
+        for key, rules in RecommendationsEngine.EFFICIENCY_RULES.items():
+            if key in name:
+                return rules
+        return None
+    
     def analyze_appliances(self, appliances: List[Dict]) -> List[Dict]:
         """Analyze appliances and return specific recommendations."""
         recommendations = []
@@ -105,19 +122,17 @@ class RecommendationsEngine:
             daily_kwh = (watts * hours) / 1000
             
             # Check against known appliance rules
-            for key, rules in self.EFFICIENCY_RULES.items():
-                if key in name:
-                    if hours > rules["max_hours"]:
-                        recommendations.append({
-                            "appliance": appliance.get("name"),
-                            "issue": f"Usage exceeds recommended {rules['max_hours']} hours/day",
-                            "tip": rules["tip"],
-                            "current_hours": hours,
-                            "recommended_hours": rules["max_hours"],
-                            "potential_savings": rules["savings_potential"],
-                            "estimated_daily_kwh": round(daily_kwh, 2)
-                        })
-                    break
+            rules = self._rule_for(name)
+            if rules and hours > rules["max_hours"]:
+                recommendations.append({
+                    "appliance": appliance.get("name"),
+                    "issue": f"Usage exceeds recommended {rules['max_hours']} hours/day",
+                    "tip": rules["tip"],
+                    "current_hours": hours,
+                    "recommended_hours": rules["max_hours"],
+                    "potential_savings": rules["savings_potential"],
+                    "estimated_daily_kwh": round(daily_kwh, 2)
+                })
             
             # High consumption warning (>5 kWh/day)
             if daily_kwh > 5:
@@ -131,8 +146,12 @@ class RecommendationsEngine:
         
         return recommendations
     
-    def get_tips_for_usage(self, daily_usage: List[Dict], appliances: List[Dict]) -> Dict:
-        """Generate comprehensive tips based on usage and appliances."""
+    def get_tips_for_usage(self, daily_usage: List[Dict], appliances: List[Dict], rotation: int = 0) -> Dict:
+        """
+        Generate comprehensive tips based on usage and appliances.
+        General tips rotate with `rotation` (e.g. the day's ordinal) through a
+        fixed-seed shuffle, so the same inputs always give the same response.
+        """
         appliance_tips = self.analyze_appliances(appliances)
         
         # Calculate metrics
@@ -140,9 +159,14 @@ class RecommendationsEngine:
         anomaly_count = 0
         
         if daily_usage:
-            consumptions = [d.get("consumption_kwh", 0) for d in daily_usage[-30:]]
-            total_daily_avg = sum(consumptions) / len(consumptions) if consumptions else 0
-            anomaly_count = sum(1 for d in daily_usage[-30:] if d.get("is_anomaly"))
+            # One pass over the last 30 days for both the total and the anomaly count
+            recent = daily_usage[-30:]
+            total_kwh = 0
+            for d in recent:
+                total_kwh += d.get("consumption_kwh", 0)
+                if d.get("is_anomaly"):
+                    anomaly_count += 1
+            total_daily_avg = total_kwh / len(recent)
         
         # Usage-based tips
         usage_tips = []
@@ -161,9 +185,11 @@ class RecommendationsEngine:
                 "impact": "high"
             })
         
-        # Shuffle and select general tips
-        import random
-        selected_general = random.sample(self.GENERAL_TIPS, min(3, len(self.GENERAL_TIPS)))
+        # Select three general tips, starting from the rotation's position
+        n_general = len(self._general_order)
+        selected_general = [
+            self._general_order[(rotation + i) % n_general] for i in range(min(3, n_general))
+        ]
         
         return {
             "appliance_specific": appliance_tips[:5],  # Limit to top 5
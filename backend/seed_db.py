@@ -6,10 +6,11 @@ import requests
 import json
 from datetime import date, timedelta
 import random
+import numpy as np
 
 BASE_URL = "http://127.0.0.1:8000"
 
-def seed():
+def seed(days: int = 10):
     # 1. Add Appliances
     appliances = [
         {"name": "Refrigerator", "power_rating_watts": 150, "usage_duration_hours_per_day": 24},
@@ -33,45 +34,36 @@ def seed():
     print(f"Added {len(appliances)} appliances.")
 
     # 2. Add Readings & Daily Usage
-    # Generate 10 days of data
-    start_date = date.today() - timedelta(days=10)
-    current_reading = 1000.0 # Initial meter reading
+    # Generate `days` days of data, drawing all the randomness up front
+    start_date = date.today() - timedelta(days=days)
+    rng = np.random.default_rng()
+    consumption = rng.uniform(10, 25, size=days)  # kWh per day
+    overnight = rng.uniform(2, 5, size=days)      # kWh between night and next morning
     
-    for i in range(10):
-        day = start_date + timedelta(days=i)
-        
-        # Morning
-        morning_val = current_reading
-        db_data["readings"].append({
-            "date": str(day),
-            "time_of_day": "morning",
-            "reading_kwh": round(morning_val, 2)
-        })
-        
-        # Consumption for day (random between 10 and 25 kWh)
-        consumption = random.uniform(10, 25)
-        
-        # Night
-        night_val = morning_val + consumption
-        db_data["readings"].append({
-            "date": str(day),
-            "time_of_day": "night",
-            "reading_kwh": round(night_val, 2)
-        })
-        
-        # Daily Usage
-        cost = consumption * 0.15
-        is_anomaly = consumption > 22 # simple rule
-        
-        db_data["daily_usage"].append({
-            "date": str(day),
-            "consumption_kwh": round(consumption, 2),
-            "cost": round(cost, 2),
-            "is_anomaly": is_anomaly,
+    # Each morning reading is the initial 1000.0 plus everything used before it
+    morning_vals = 1000.0 + np.concatenate(([0.0], np.cumsum(consumption + overnight)[:-1]))
+    night_vals = morning_vals + consumption
+    
+    dates = [str(start_date + timedelta(days=i)) for i in range(days)]
+    consumption_r = np.round(consumption, 2).tolist()
+    cost_r = np.round(consumption * 0.15, 2).tolist()
+    is_anomaly = (consumption > 22).tolist()  # simple rule
+    
+    db_data["readings"] = [
+        {"date": day, "time_of_day": time_of_day, "reading_kwh": value}
+        for day, morning, night in zip(dates, np.round(morning_vals, 2).tolist(), np.round(night_vals, 2).tolist())
+        for time_of_day, value in (("morning", morning), ("night", night))
+    ]
+    db_data["daily_usage"] = [
+        {
+            "date": day,
+            "consumption_kwh": consumption_r[i],
+            "cost": cost_r[i],
+            "is_anomaly": is_anomaly[i],
             "readings_count": 2
-        })
-        
-        current_reading = night_val + random.uniform(2, 5) # Overnight usage
+        }
+        for i, day in enumerate(dates)
+    ]
         
     with open("e:/New folder/backend/db.json", "w") as f: # Adjust path relative to where script runs usually
         json.dump(db_data, f, indent=4)
@@ -5,7 +5,10 @@ Based on TNEB domestic tariff rates
 IMPORTANT: TNEB uses BI-MONTHLY billing (once every 2 months)
 The 100 free units apply to each 2-month billing period.
 """
-from typing import Dict, List
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import accumulate
+from typing import Dict, List, Tuple
 
 # Tamil Nadu Domestic Electricity Slab Rates (in ₹ per unit/kWh)
 # These slabs are for BI-MONTHLY (2 month) billing periods
@@ -23,51 +26,76 @@ TAMILNADU_SLABS_BIMONTHLY = [
 # Billing cycle type
 BILLING_CYCLE = "bi-monthly"  # 2 months
 
+# The slab schedule flattened once into (label, width, rate) tuples, so the
+# bill walk does no dict lookups or infinity checks per slab
+_SLAB_TABLE = tuple(
+    (
+        f"{s['min']}-{s['max'] if s['max'] != float('inf') else '∞'}",
+        s["max"] if s["max"] == float('inf') else s["max"] - s["min"] + 1,
+        s["rate"],
+    )
+    for s in TAMILNADU_SLABS_BIMONTHLY
+)
 
-def calculate_bimonthly_bill(total_units: float) -> Dict:
-    """
-    Calculate electricity bill using Tamil Nadu bi-monthly slab rates.
-    
-    Args:
-        total_units: Total bi-monthly (2-month) consumption in kWh/units
-    
-    Returns:
-        Dictionary with bill breakdown
-    """
-    total_units = max(0, total_units)
+# Closed form of the walk's total: the units where each slab starts and ends,
+# and the cost of all full slabs below it, summed in the walk's order so
+# totals come out bit-identical
+_SLAB_STARTS = list(accumulate((width for _, width, _ in _SLAB_TABLE[:-1]), initial=0))
+_SLAB_BASE_COSTS = list(accumulate((width * rate for _, width, rate in _SLAB_TABLE[:-1]), initial=0.0))
+_SLAB_ENDS = _SLAB_STARTS[1:]
+_SLAB_RATES = [rate for _, _, rate in _SLAB_TABLE]
+
+
+# Bills are pure functions of the unit count, so the slab walk is memoized;
+# callers get freshly built dicts so they can't alter the cached result
+@lru_cache(maxsize=4096, typed=True)
+def _slab_walk(total_units: float) -> Tuple[float, tuple]:
+    """Total cost and (slab, units, rate, amount) rows for bi-monthly units."""
     remaining_units = total_units
     total_cost = 0.0
     breakdown = []
     
-    for slab in TAMILNADU_SLABS_BIMONTHLY:
+    for label, width, rate in _SLAB_TABLE:
         if remaining_units <= 0:
             break
         
-        slab_min = slab["min"]
-        slab_max = slab["max"]
-        rate = slab["rate"]
-        
-        # Calculate units in this slab
-        if slab_max == float('inf'):
-            units_in_slab = remaining_units
-        else:
-            slab_range = slab_max - slab_min + 1
-            units_in_slab = min(remaining_units, slab_range)
+        # Calculate units in this slab (the last slab's width is infinite)
+        units_in_slab = min(remaining_units, width)
         
         # Calculate cost for this slab
         slab_cost = units_in_slab * rate
         total_cost += slab_cost
         
         if units_in_slab > 0:
-            breakdown.append({
-                "slab": f"{slab_min}-{slab_max if slab_max != float('inf') else '∞'}",
-                "units": round(units_in_slab, 2),
-                "rate": rate,
-                "amount": round(slab_cost, 2)
-            })
+            breakdown.append((
+                label,
+                round(units_in_slab, 2),
+                rate,
+                round(slab_cost, 2)
+            ))
         
         remaining_units -= units_in_slab
     
+    return total_cost, tuple(breakdown)
+
+
+def calculate_bimonthly_bill(total_units: float) -> Dict:
+    """
+    Calculate electricity bill using Tamil Nadu bi-monthly slab rates.
+    
+    Args:
+        total_units: Total bi-monthly (2-month) consumption in kWh/units
+    
+    Returns:
+        Dictionary with bill breakdown
+    """
+    total_units = max(0, total_units)
+    total_cost, slab_rows = _slab_walk(total_units)
+    breakdown = [
+        {"slab": slab, "units": units, "rate": rate, "amount": amount}
+        for slab, units, rate, amount in slab_rows
+    ]
+    
     # Calculate average rate
     avg_rate = total_cost / total_units if total_units > 0 else 0
     
@@ -109,6 +137,20 @@ def calculate_monthly_bill(monthly_units: float) -> Dict:
     }
 
 
+def _bimonthly_total(total_units: float) -> float:
+    """The slab walk's total cost, found by a bisect over the slab ends."""
+    if total_units <= 0:
+        return 0.0
+    i = bisect_left(_SLAB_ENDS, total_units)
+    return _SLAB_BASE_COSTS[i] + (total_units - _SLAB_STARTS[i]) * _SLAB_RATES[i]
+
+
+def _monthly_amount(monthly_units: float) -> float:
+    """calculate_monthly_bill(monthly_units)["total_amount"], without building the breakdown."""
+    return round(round(_bimonthly_total(monthly_units * 2), 2) / 2, 2)
+
+
+@lru_cache(maxsize=4096, typed=True)
 def calculate_daily_cost(daily_kwh: float, monthly_estimate_kwh: float = None) -> float:
     """
     Calculate daily cost based on estimated monthly usage slab.
@@ -123,12 +165,9 @@ def calculate_daily_cost(daily_kwh: float, monthly_estimate_kwh: float = None) -
     if monthly_estimate_kwh is None:
         monthly_estimate_kwh = daily_kwh * 30
     
-    # Get monthly bill estimate
-    monthly_bill = calculate_monthly_bill(monthly_estimate_kwh)
-    
-    # Calculate daily cost proportionally
+    # Calculate daily cost proportionally to the monthly bill estimate
     if monthly_estimate_kwh > 0:
-        daily_cost = (daily_kwh / monthly_estimate_kwh) * monthly_bill["total_amount"]
+        daily_cost = (daily_kwh / monthly_estimate_kwh) * _monthly_amount(monthly_estimate_kwh)
     else:
         daily_cost = 0
     